@@ -8,6 +8,8 @@ from dotenv import load_dotenv
 # Initialize extensions
 login_manager = LoginManager()
 db = None  # Will be initialized with BigQueryDB instance
+gate_registry = None  # Will be initialized with GateStatusRegistry instance
+replica = None  # Will be initialized with LocalReplica instance
 
 def create_app():
     load_dotenv()  # Load environment variables from .env file if it exists
@@ -16,11 +18,28 @@ def create_app():
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-key-change-this')
     
     # Initialize BigQuery connection
-    global db
+    global db, gate_registry, replica
     project_id = os.getenv('GOOGLE_CLOUD_PROJECT')
     if not project_id:
         raise ValueError("GOOGLE_CLOUD_PROJECT environment variable must be set")
-    db = BigQueryDB(project_id)
+    db = BigQueryDB(project_id,
+                    dashboard_cache_ttl=int(os.getenv('DASHBOARD_CACHE_TTL', 30)),
+                    user_cache_ttl=int(os.getenv('USER_CACHE_TTL', 300)),
+                    access_log_max_scan_days=int(os.getenv('ACCESS_LOG_MAX_SCAN_DAYS', 365)))
+
+    # Local copy of the Vehicle and Gate tables serving the web pages
+    from .database.replica import LocalReplica
+    replica = LocalReplica(db, reconcile_interval=int(os.getenv('REPLICA_RECONCILE_INTERVAL', 300)))
+    try:
+        replica.load()
+    except Exception as e:
+        print(f"Error loading local replica, it will be loaded on first use: {e}")
+    replica.start()
+
+    # Live gate statuses, written back to BigQuery in the background
+    from .gate_status import GateStatusRegistry
+    gate_registry = GateStatusRegistry(db, flush_interval=int(os.getenv('GATE_STATUS_FLUSH_INTERVAL', 30)),
+                                       streaming_buffer_window=int(os.getenv('GATE_STREAMING_BUFFER_WINDOW', 5400)))
     
     # Initialize login manager with stricter settings
     login_manager.init_app(app)
@@ -0,0 +1,196 @@
+import importlib
+import os
+import sys
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class ANPRError(Exception):
+    """Raised when the ANPR service returns an error or cannot be reached"""
+
+
+class CircuitOpenError(ANPRError):
+    """Raised when the circuit breaker rejects a call without trying it"""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service for a while.
+
+    After failure_threshold consecutive failures the breaker opens and every
+    call is rejected at once. Once reset_timeout seconds have passed a single
+    trial call is let through (half-open): success closes the breaker again,
+    failure re-opens it.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Check whether a call may go through"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"ANPR circuit breaker opened after {self._failures} failures")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class ANPRClient:
+    """
+    HTTP client for the YOLO ANPR service.
+
+    Keeps a pool of keep-alive connections, applies connect/read timeouts,
+    retries connection errors and 502/503/504 answers with backoff, and
+    guards the service with a circuit breaker.
+    """
+
+    def __init__(self, base_url, connect_timeout=2.0, read_timeout=10.0, max_retries=2,
+                 backoff_factor=0.3, pool_size=10, breaker=None):
+        self.base_url = base_url.rstrip('/') if base_url else ''
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = breaker or CircuitBreaker()
+
+        # Read timeouts are not retried: the service may still be busy with
+        # the frame and a retry would only pile more work on it
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET', 'POST']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def recognize(self, image_data=None, url=None, gate_id=None):
+        """
+        Recognize the plate on an image
+
+        Args:
+            image_data (bytes or memoryview): Raw JPEG data, used when url is None
+            url (str): URL of an image the service should download instead
+            gate_id (str): Gate that sent the frame, selects its region of interest
+
+        Returns:
+            tuple: (plate_text, confidence)
+
+        Raises:
+            CircuitOpenError: The service is failing and the call was not attempted
+            ANPRError: The service answered with an error or could not be reached
+        """
+        if not self.breaker.allow_request():
+            raise CircuitOpenError("ANPR service circuit is open")
+
+        params = {'gate_id': gate_id} if gate_id else None
+        try:
+            if url is None:
+                # Sent as the raw request body: no multipart framing or copy of the image
+                response = self.session.post(f"{self.base_url}/api/anpr", data=image_data, params=params,
+                                             headers={'Content-Type': 'image/jpeg'}, timeout=self.timeout)
+            else:
+                response = self.session.get(f"{self.base_url}/api/anpr/url",
+                                            params={'image': url, **(params or {})}, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            self.breaker.record_failure()
+            raise ANPRError(f"ANPR service unreachable: {e}") from e
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            raise ANPRError(f"ANPR service error {response.status_code}: {response.text}")
+
+        # Any answer below 500 means the service itself is healthy
+        self.breaker.record_success()
+        if response.status_code != 200:
+            raise ANPRError(f"ANPR service rejected the request {response.status_code}: {response.text}")
+
+        result = response.json()
+        return result['plate_text'], result['confidence']
+
+
+class InProcessANPRBackend:
+    """
+    Runs the YOLO + PaddleOCR pipeline of docker/yolo inside this process.
+
+    Meant for single-host deployments: frames skip the HTTP request and
+    the JSON answer. The pipeline module is imported from pipeline_dir on
+    load(), which also starts warming the models up in the background.
+    """
+
+    def __init__(self, pipeline_dir):
+        self.pipeline_dir = os.path.abspath(pipeline_dir)
+        self._pipeline = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Import the pipeline and load its models"""
+        with self._lock:
+            if self._pipeline is not None:
+                return self._pipeline
+            if self.pipeline_dir not in sys.path:
+                sys.path.insert(0, self.pipeline_dir)
+            pipeline = importlib.import_module('anpr')
+            threading.Thread(target=pipeline.warm_up, name='anpr-warm-up', daemon=True).start()
+            self._pipeline = pipeline
+            return pipeline
+
+    def recognize(self, image_data=None, url=None, gate_id=None):
+        """
+        Recognize the plate on an image
+
+        Args:
+            image_data (bytes or memoryview): Raw JPEG data, used when url is None
+            url (str): URL of an image to download instead
+            gate_id (str): Gate that sent the frame, selects its region of interest
+
+        Returns:
+            tuple: (plate_text, confidence)
+
+        Raises:
+            ANPRError: The pipeline failed on the image
+        """
+        pipeline = self.load()
+        try:
+            image = pipeline.fetch_image(url) if url is not None else image_data
+            _, plate_text, confidence = pipeline.detect_and_recognize(image, gate_id=gate_id)
+        except Exception as e:
+            raise ANPRError(f"ANPR pipeline error: {e}") from e
+        return plate_text, float(confidence)
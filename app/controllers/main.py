@@ -1,24 +1,23 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, stream_template
 from flask_login import login_required, current_user
 from ..database.models import Vehicle, AccessLog, Gate, Pagination
 from datetime import datetime
-from .. import db
+from .. import db, gate_registry, replica
+from .. import mqtt_handler
 
 main_bp = Blueprint('main', __name__)
 
 @main_bp.route('/')
 @login_required
 def dashboard():
-    # Get recent access logs
-    recent_logs = db.get_access_logs(limit=10)
+    # Recent access logs and statistics come from one cached batch of queries
+    recent_logs, cached_stats = db.get_dashboard_data(log_limit=10)
+    gates = [gate_registry.apply(Gate(g)) for g in replica.list_gates()]
     
-    # Get gate statuses
-    gates_data = db.list_gates()
-    gates = [Gate(g) for g in gates_data]
-    
-    # Get statistics
-    stats = db.get_dashboard_stats()
+    # The cached dict is shared between requests, so work on a copy
+    stats = dict(cached_stats)
     stats['total_gates'] = len(gates)  # Añadir total_gates al diccionario de stats
+    stats['online_gates'] = gate_registry.online_count()
     
     return render_template('main/dashboard.html',
                          logs=recent_logs,
@@ -28,9 +27,22 @@ def dashboard():
 @main_bp.route('/vehicles')
 @login_required
 def list_vehicles():
-    vehicles_data = db.list_vehicles()
+    search = request.args.get('q', '').strip()
+
+    # Stream every matching row instead of building one page in memory
+    if request.args.get('stream', type=int):
+        vehicles = (Vehicle(v) for v in replica.iter_vehicles(search))
+        return stream_template('main/vehicles.html', vehicles=vehicles, pagination=None, search=search)
+
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 50, type=int)
+    if per_page not in [25, 50, 100]:
+        per_page = 50
+
+    vehicles_data, total = replica.search_vehicles(search, page, per_page)
     vehicles = [Vehicle(v) for v in vehicles_data]
-    return render_template('main/vehicles.html', vehicles=vehicles)
+    pagination = Pagination(vehicles, page, per_page, total)
+    return render_template('main/vehicles.html', vehicles=vehicles, pagination=pagination, search=search)
 
 @main_bp.route('/vehicles/add', methods=['GET', 'POST'])
 @login_required
@@ -43,11 +55,11 @@ def add_vehicle():
         if valid_until:
             valid_until = datetime.strptime(valid_until, '%Y-%m-%d')
         
-        if db.get_vehicle_by_plate(plate_number):
+        if replica.get_vehicle(plate_number):
             flash('Vehicle already exists')
             return redirect(url_for('main.add_vehicle'))
         
-        success, errors = db.add_vehicle(plate_number, owner_name, valid_from, valid_until)
+        success, errors = replica.add_vehicle(plate_number, owner_name, valid_from, valid_until)
         if not success:
             flash(f'Error adding vehicle: {errors}')
             return redirect(url_for('main.add_vehicle'))
@@ -60,7 +72,7 @@ def add_vehicle():
 @main_bp.route('/vehicles/<string:plate_number>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_vehicle(plate_number):
-    vehicle_data = db.get_vehicle_by_plate(plate_number)
+    vehicle_data = replica.get_vehicle(plate_number)
     if not vehicle_data:
         flash('Vehicle not found')
         return redirect(url_for('main.list_vehicles'))
@@ -76,7 +88,7 @@ def edit_vehicle(plate_number):
             if valid_until:
                 valid_until = datetime.strptime(valid_until, '%Y-%m-%d')            
             
-            success, error = db.update_vehicle(plate_number, owner_name, is_authorized, valid_from, valid_until)
+            success, error = replica.update_vehicle(plate_number, owner_name, is_authorized, valid_from, valid_until)
             if not success:
                 raise Exception(error)
             
@@ -93,6 +105,14 @@ def edit_vehicle(plate_number):
     
     return render_template('main/edit_vehicle.html', vehicle=vehicle)
 
+@main_bp.route('/vehicles/<string:plate_number>/delete', methods=['POST'])
+@login_required
+def delete_vehicle(plate_number):
+    success, error = replica.delete_vehicle(plate_number)
+    if success:
+        return jsonify({'status': 'success'})
+    return jsonify({'status': 'error', 'message': error}), 500
+
 @main_bp.route('/access-logs')
 @login_required
 def access_logs():
@@ -113,7 +133,12 @@ def access_logs():
     if sort_order not in ['asc', 'desc']:
         sort_order = 'desc'
     
-    pagination_obj = db.get_paginated_access_logs(page, per_page, sort_by, sort_order)
+    cursor = request.args.get('cursor')
+    try:
+        pagination_obj = db.get_access_logs_page(per_page, sort_by, sort_order, cursor=cursor, page=page)
+    except Exception as e:
+        print(f"Error retrieving access logs: {e}")
+        pagination_obj = None
     
     if pagination_obj is None:
         flash('Error retrieving access logs', 'error')
@@ -126,8 +151,8 @@ def access_logs():
 @main_bp.route('/gates', methods=['GET'])
 @login_required
 def gates():
-    gates_data = db.list_gates()
-    gates = [Gate(g) for g in gates_data]
+    gates_data = replica.list_gates()
+    gates = [gate_registry.apply(Gate(g)) for g in gates_data]
     return render_template('main/gates.html', gates=gates)
 
 @main_bp.route('/gates/add', methods=['POST'])
@@ -136,12 +161,13 @@ def add_gate():
     gate_id = request.form.get('gate_id')
     location = request.form.get('location')
     
-    if db.get_gate(gate_id):
+    if replica.get_gate(gate_id):
         flash('Gate ID already exists')
         return redirect(url_for('main.gates'))
     
-    success, errors = db.add_gate(gate_id, location)
+    success, errors = replica.add_gate(gate_id, location)
     if success:
+        gate_registry.add(gate_id, location)
         flash('Gate added successfully')
     else:
         flash(f'Error adding gate: {errors}')
@@ -150,17 +176,25 @@ def add_gate():
 @main_bp.route('/gates/<gate_id>/delete', methods=['POST'])
 @login_required
 def delete_gate(gate_id):
-    if db.delete_gate(gate_id):
+    if replica.delete_gate(gate_id):
+        gate_registry.load()
         return jsonify({'status': 'success'})
     return jsonify({'status': 'error'}), 500
 
 @main_bp.route('/gates/<gate_id>/sync', methods=['POST'])
 @login_required
 def sync_gate(gate_id):
-    if db.sync_gate(gate_id):
+    if replica.sync_gate(gate_id):
         return jsonify({'status': 'success'})
     return jsonify({'status': 'error'}), 500
 
+@main_bp.route('/metrics/mqtt')
+@login_required
+def mqtt_metrics():
+    if mqtt_handler.dispatcher is None:
+        return jsonify({'status': 'error', 'message': 'MQTT dispatcher not running'}), 503
+    return jsonify(mqtt_handler.dispatcher.stats())
+
 @main_bp.route('/looker-reports')
 @login_required
 def looker_studio_reports():
@@ -1,16 +1,30 @@
 from google.cloud import bigquery
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import base64
+import json
 import uuid
 
+from .cache import TTLCache
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
 class BigQueryDB:
-    def __init__(self, project_id):
+    def __init__(self, project_id, count_cache_ttl=60, access_log_scan_days=7, dashboard_cache_ttl=30,
+                 user_cache_ttl=300, sync_info_ttl=5, access_log_max_scan_days=365):
         self.client = bigquery.Client(project=project_id)
+        self.access_log_scan_days = access_log_scan_days
+        self.access_log_max_scan_days = access_log_max_scan_days
+        self._count_cache = TTLCache(count_cache_ttl)
+        self._dashboard_cache = TTLCache(dashboard_cache_ttl)
+        self._user_cache = TTLCache(user_cache_ttl)
+        self._sync_info_cache = TTLCache(sync_info_ttl)
         self.dataset_id = "IoT2"
         self.tables = {
             "User": "User",
             "Vehicle": "Vehicle",
             "AccessLog": "AccessLog",
-            "Gate": "Gate"
+            "Gate": "Gate",
+            "VehicleTombstone": "VehicleTombstone"
         }
 
     def get_table_ref(self, table_name):
@@ -34,6 +48,21 @@ class BigQueryDB:
         return None
     
     def get_user_by_id(self, user_id):
+        """Get a user by id; found users are cached for user_cache_ttl seconds"""
+        user = self._user_cache.get(user_id)
+        if user is not None:
+            return user
+
+        user = self._query_user_by_id(user_id)
+        if user is not None:
+            self._user_cache.set(user_id, user)
+        return user
+
+    def invalidate_user(self, user_id=None):
+        """Drop a cached user, or every cached user when user_id is None"""
+        self._user_cache.invalidate(user_id)
+
+    def _query_user_by_id(self, user_id):
         query = f"""
         SELECT id, username, password, is_admin, created_at 
         FROM `{self.get_table_ref('User')}`
@@ -67,6 +96,7 @@ class BigQueryDB:
         errors = self.client.insert_rows_json(table_ref, rows_to_insert)
         if errors:
             print(f"BigQuery insert error: {errors}")
+        self.invalidate_user()
         return len(errors) == 0
 
 
@@ -78,8 +108,10 @@ class BigQueryDB:
 
     # Vehicle operations
     def get_vehicles(self):
+        # Stable order so a rebuilt sync transfer splits into the same chunks
         query = f"""
         SELECT * FROM `{self.get_table_ref('Vehicle')}`
+        ORDER BY plate_number
         """
         return list(self.client.query(query).result())
 
@@ -102,12 +134,12 @@ class BigQueryDB:
         results = list(self.client.query(query).result())
         return results
 
-    def add_vehicle(self, plate_number, owner_name, valid_from, valid_until=None, is_authorized=True):
+    def add_vehicle(self, plate_number, owner_name, valid_from, valid_until=None, is_authorized=True, row_id=None):
         """Add a new vehicle to the database"""
         try:
             table_ref = self.get_table_ref('Vehicle')
             rows_to_insert = [{
-                'id': str(uuid.uuid4()),
+                'id': row_id or str(uuid.uuid4()),
                 'plate_number': plate_number,
                 'owner_name': owner_name,
                 'is_authorized': is_authorized,
@@ -117,82 +149,189 @@ class BigQueryDB:
             }]
             
             errors = self.client.insert_rows_json(table_ref, rows_to_insert)
+            self._sync_info_cache.invalidate()
             return len(errors) == 0, errors
         except Exception as e:
             return False, str(e)
 
-    def get_paginated_access_logs(self, page=1, per_page=20, sort_by='timestamp', sort_order='desc'):
-        """Get paginated access logs with sorting"""
-        # Calculate offset
-        offset = (page - 1) * per_page
+    def delete_vehicle(self, plate_number):
+        """Delete a vehicle and record a tombstone so gates drop it on their next delta sync"""
+        try:
+            tombstone_errors = self.client.insert_rows_json(self.get_table_ref('VehicleTombstone'), [{
+                'plate_number': plate_number,
+                # Same clock as Vehicle.last_sync, both feed the sync version
+                'deleted_at': datetime.now().isoformat()
+            }])
+            if tombstone_errors:
+                return False, tombstone_errors
 
-        # Validate sort parameters
-        allowed_sort_fields = {'timestamp': 'timestamp', 'access_granted': 'access_granted'}
-        sort_field = allowed_sort_fields.get(sort_by, 'timestamp')
-        order = 'DESC' if sort_order.lower() == 'desc' else 'ASC'
+            delete_query = f"""
+            DELETE FROM `{self.get_table_ref('Vehicle')}`
+            WHERE plate_number = @plate_number
+            """
+            job_config = bigquery.QueryJobConfig(
+                query_parameters=[
+                    bigquery.ScalarQueryParameter("plate_number", "STRING", plate_number)
+                ]
+            )
+            self.client.query(delete_query, job_config=job_config).result()
+            self._sync_info_cache.invalidate()
+            return True, None
+        except Exception as e:
+            return False, str(e)
 
-        # Get total count
-        count_query = f"SELECT COUNT(*) as total FROM `{self.get_table_ref('AccessLog')}`"
-        total_count = next(self.client.query(count_query).result()).total
+    def get_vehicle_changes(self, since_version):
+        """
+        Get the vehicles changed and the plates deleted after a sync version
 
-        # Get paginated and sorted results
-        query = f"""
-        SELECT *
-        FROM `{self.get_table_ref('AccessLog')}`
-        ORDER BY {sort_field} {order}
-        LIMIT @per_page
-        OFFSET @offset
+        Args:
+            since_version (int): Sync version (microseconds since epoch) the gate has
+
+        Returns:
+            tuple: (changed vehicle rows, list of deleted plate numbers)
         """
-        
         job_config = bigquery.QueryJobConfig(
             query_parameters=[
-                bigquery.ScalarQueryParameter("per_page", "INT64", per_page),
-                bigquery.ScalarQueryParameter("offset", "INT64", offset)
+                bigquery.ScalarQueryParameter("since", "INT64", since_version)
             ]
         )
-        
-        results = list(self.client.query(query, job_config=job_config).result())
-        
-        # Calculate pagination metadata
-        total_pages = -(-total_count // per_page)  # Ceiling division
-        has_prev = page > 1
-        has_next = page < total_pages
-
-        # Create Pagination object
-        pagination = {
-            'items': results,
-            'page': page,
-            'per_page': per_page,
-            'total': total_count,
-            'pages': total_pages,
-            'has_prev': has_prev,
-            'has_next': has_next,
-            'prev_num': page - 1 if has_prev else None,
-            'next_num': page + 1 if has_next else None,
-            'iter_pages': lambda left_edge=2, left_current=2, right_current=3, right_edge=2: self._iter_pages(
-                page, total_pages, left_edge, left_current, right_current, right_edge
-            )
-        }
-        
-        return type('Pagination', (), pagination)  # Create object with pagination attributes
-
-    def _iter_pages(self, curr_page, num_pages, left_edge=2, left_current=2, right_current=3, right_edge=2):
-        """Helper function to generate page numbers for pagination"""
-        last = 0
-        for num in range(1, num_pages + 1):
-            if num <= left_edge or \
-               (num > curr_page - left_current - 1 and num < curr_page + right_current) or \
-               num > num_pages - right_edge:
-                if last + 1 != num:
-                    yield None
-                yield num
-                last = num
+        changes_query = f"""
+        SELECT * FROM `{self.get_table_ref('Vehicle')}`
+        WHERE last_sync > DATETIME(TIMESTAMP_MICROS(@since))
+        ORDER BY plate_number
+        """
+        # A plate deleted and then added again is an upsert, not a deletion
+        tombstones_query = f"""
+        SELECT DISTINCT plate_number FROM `{self.get_table_ref('VehicleTombstone')}`
+        WHERE deleted_at > DATETIME(TIMESTAMP_MICROS(@since))
+        AND plate_number NOT IN (SELECT plate_number FROM `{self.get_table_ref('Vehicle')}`)
+        """
+        # Start both jobs before waiting on either
+        changes_job = self.client.query(changes_query, job_config=job_config)
+        tombstones_job = self.client.query(tombstones_query, job_config=job_config)
+        changed = list(changes_job.result())
+        deleted = [row.plate_number for row in tombstones_job.result()]
+        return changed, deleted
+
+    def count_access_logs(self):
+        """Approximate number of access logs, cached for a short time"""
+        return self._count_cache.get_or_load('AccessLog', self._count_access_logs)
+
+    def _count_access_logs(self):
+        try:
+            # Table metadata is free, unlike a COUNT(*) scan
+            table = self.client.get_table(self.get_table_ref('AccessLog'))
+            total = table.num_rows or 0
+            if table.streaming_buffer is not None:
+                total += table.streaming_buffer.estimated_rows or 0
+            return total
+        except Exception as e:
+            print(f"Error reading AccessLog metadata, counting rows: {e}")
+            count_query = f"SELECT COUNT(*) as total FROM `{self.get_table_ref('AccessLog')}`"
+            return next(self.client.query(count_query).result()).total
+
+    def get_access_logs_page(self, per_page=10, sort_by='timestamp', sort_order='desc', cursor=None, page=1):
+        """
+        Get a page of access logs with keyset pagination.
+        Pages are addressed by a cursor holding the sort key of the last (or
+        first) row shown, so deep pages cost the same as the first one.
+
+        Args:
+            cursor (str): Cursor returned as next_cursor/prev_cursor of another page
+            page (int): Page number, only used for display
+
+        Returns:
+            CursorPagination: The page of logs
+        """
+        allowed_sort_fields = {'timestamp': 'timestamp', 'access_granted': 'access_granted'}
+        sort_field = allowed_sort_fields.get(sort_by, 'timestamp')
+        descending = sort_order.lower() == 'desc'
+
+        # Sort keys, made unique with the log id
+        keys = [('timestamp', 'DATETIME'), ('id', 'STRING')]
+        if sort_field == 'access_granted':
+            keys.insert(0, ('access_granted', 'BOOL'))
+
+        position = _decode_cursor(cursor, len(keys))
+        if position is None:
+            page = 1
+        backwards = position is not None and position['d'] == 'prev'
+        # Going back scans in the opposite order; rows are reversed afterwards
+        scan_descending = descending != backwards
+
+        conditions = []
+        parameters = [bigquery.ScalarQueryParameter("limit", "INT64", per_page + 1)]
+        if position is not None:
+            conditions.append(_keyset_condition([name for name, _ in keys], '<' if scan_descending else '>'))
+            parameters += [
+                bigquery.ScalarQueryParameter(f"k{index}", key_type, value)
+                for index, ((_, key_type), value) in enumerate(zip(keys, position['k']))
+            ]
+
+        # Bound the scan to a window next to the cursor so a date-partitioned
+        # table only reads the partitions it needs
+        anchor = None
+        if sort_field == 'timestamp':
+            if position is not None:
+                anchor = datetime.fromisoformat(position['k'][0])
+            elif scan_descending:
+                anchor = datetime.utcnow()
+
+        order = 'DESC' if scan_descending else 'ASC'
+        order_by = ', '.join(f"{name} {order}" for name, _ in keys)
+
+        def run(where, window_days=None):
+            query_parameters = list(parameters)
+            if window_days is not None:
+                window = timedelta(days=window_days)
+                window_edge = anchor - window if scan_descending else anchor + window
+                where = where + ["timestamp >= @window_edge" if scan_descending else "timestamp <= @window_edge"]
+                query_parameters.append(
+                    bigquery.ScalarQueryParameter("window_edge", "DATETIME", window_edge.isoformat()))
+            query = f"""
+            SELECT *
+            FROM `{self.get_table_ref('AccessLog')}`
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY {order_by}
+            LIMIT @limit
+            """
+            job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
+            return list(self.client.query(query, job_config=job_config).result())
+
+        if anchor is not None:
+            # Widen the window while it comes up short, up to
+            # access_log_max_scan_days; logs older than that are not paged to
+            window_days = self.access_log_scan_days
+            while True:
+                results = run(conditions, window_days)
+                if len(results) > per_page or window_days >= self.access_log_max_scan_days:
+                    break
+                window_days = min(window_days * 4, self.access_log_max_scan_days)
+        else:
+            results = run(conditions)
+
+        from .models import CursorPagination
+
+        has_more = len(results) > per_page
+        results = results[:per_page]
+        if backwards:
+            results.reverse()
+            has_prev, has_next = has_more, True
+        else:
+            has_prev, has_next = position is not None, has_more
+
+        return CursorPagination(
+            items=results,
+            page=page,
+            per_page=per_page,
+            total=self.count_access_logs(),
+            next_cursor=_encode_cursor(keys, results[-1], 'next') if has_next and results else None,
+            prev_cursor=_encode_cursor(keys, results[0], 'prev') if has_prev and results else None
+        )
 
     # AccessLog operations
-    def create_access_log(self, id, plate_number, gate_id, access_granted, confidence_score=None, timestamp=None, accessing=False):
-        table_ref = self.get_table_ref('AccessLog')
-        
-        rows_to_insert = [{
+    def _access_log_row(self, id, plate_number, gate_id, access_granted, confidence_score=None, timestamp=None, accessing=False):
+        return {
             'id': id,
             'plate_number': plate_number,
             'gate_id': gate_id,
@@ -200,12 +339,60 @@ class BigQueryDB:
             'confidence_score': confidence_score,
             'timestamp': timestamp if timestamp else datetime.now().isoformat(),
             'accessing': True if accessing else False
-        }]
+        }
+
+    def create_access_log(self, id, plate_number, gate_id, access_granted, confidence_score=None, timestamp=None, accessing=False):
+        table_ref = self.get_table_ref('AccessLog')
+        
+        rows_to_insert = [self._access_log_row(id, plate_number, gate_id, access_granted,
+                                               confidence_score, timestamp, accessing)]
         # Insert the log 
-        errors = self.client.insert_rows_json(table_ref, rows_to_insert)
+        errors = self.client.insert_rows_json(table_ref, rows_to_insert, row_ids=[id])
 
         return len(errors) == 0
 
+    def create_access_logs_bulk(self, logs):
+        """
+        Insert a batch of access logs with a single streaming insert request.
+        The log id is used as insertId, so BigQuery drops the duplicates when a
+        gate retries a batch that was already stored.
+
+        Args:
+            logs (list): Dicts with the create_access_log arguments
+
+        Returns:
+            tuple: (ids of the inserted logs, ids of the logs that failed)
+        """
+        rows = []
+        failed = []
+        for log in logs:
+            try:
+                rows.append(self._access_log_row(**log))
+            except TypeError as e:
+                print(f"Invalid access log {log.get('id')}: {e}")
+                failed.append(log.get('id'))
+        if not rows:
+            return [], failed
+
+        log_ids = [row['id'] for row in rows]
+        try:
+            errors = self.client.insert_rows_json(
+                self.get_table_ref('AccessLog'),
+                rows,
+                row_ids=log_ids,
+                skip_invalid_rows=True
+            )
+        except Exception as e:
+            print(f"BigQuery bulk insert error: {e}")
+            return [], failed + log_ids
+
+        if errors:
+            print(f"BigQuery insert errors: {errors}")
+        failed_indexes = {error['index'] for error in errors}
+        inserted = [log_id for index, log_id in enumerate(log_ids) if index not in failed_indexes]
+        failed.extend(log_ids[index] for index in sorted(failed_indexes))
+        return inserted, failed
+
     def get_access_logs(self, gate_id=None, limit=100):
         query = f"""
         SELECT * FROM `{self.get_table_ref('AccessLog')}`
@@ -272,19 +459,58 @@ class BigQueryDB:
             print(f"Error updating gate status: {e}")
             return False
 
+    def update_gate_statuses(self, updates):
+        """
+        Update the status of several gates with one DML statement
+
+        Args:
+            updates (list): Dicts with gate_id, status and last_online (datetime or None)
+        """
+        if not updates:
+            return True
+        try:
+            query = f"""
+            UPDATE `{self.get_table_ref('Gate')}` g
+            SET status = u.status,
+                last_online = COALESCE(u.last_online, g.last_online)
+            FROM UNNEST(@updates) u
+            WHERE g.gate_id = u.gate_id
+            """
+            job_config = bigquery.QueryJobConfig(
+                query_parameters=[
+                    bigquery.ArrayQueryParameter("updates", "STRUCT", [
+                        bigquery.StructQueryParameter(
+                            None,
+                            bigquery.ScalarQueryParameter("gate_id", "STRING", update['gate_id']),
+                            bigquery.ScalarQueryParameter("status", "STRING", update['status']),
+                            bigquery.ScalarQueryParameter(
+                                "last_online", "DATETIME",
+                                update['last_online'].isoformat() if update['last_online'] else None
+                            )
+                        ) for update in updates
+                    ])
+                ]
+            )
+            self.client.query(query, job_config=job_config).result()
+            return True
+        except Exception as e:
+            print(f"Error updating gate statuses: {e}")
+            return False
+
     def list_gates(self):
         """Get all gates"""
         query = f"SELECT * FROM `{self.get_table_ref('Gate')}`"
         return list(self.client.query(query).result())
 
-    def add_gate(self, gate_id, location):
+    def add_gate(self, gate_id, location, row_id=None, status='offline', last_online=None):
         """Add a new gate"""
         table_ref = self.get_table_ref('Gate')
         rows_to_insert = [{
-            'id': str(uuid.uuid4()),
+            'id': row_id or str(uuid.uuid4()),
             'gate_id': gate_id,
             'location': location,
-            'status': 'offline'
+            'status': status,
+            'last_online': last_online.isoformat() if last_online else None
         }]
         
         errors = self.client.insert_rows_json(table_ref, rows_to_insert)
@@ -354,46 +580,49 @@ class BigQueryDB:
             
             query_job = self.client.query(update_query, job_config=job_config)
             query_job.result()
+            self._sync_info_cache.invalidate()
             return True, None
         except Exception as e:
             return False, str(e)
 
-    def get_dashboard_stats(self):
-        """Get statistics for the dashboard"""
-        try:
-            # Query for total number of vehicles
-            vehicle_count_query = f"""
-            SELECT COUNT(*) as count 
-            FROM `{self.get_table_ref('Vehicle')}`
-            WHERE is_authorized = TRUE
-            """
-            vehicle_count = next(self.client.query(vehicle_count_query).result()).count
-
-            # Query for today's access attempts
-            today_attempts_query = f"""
-            SELECT 
+    def _dashboard_stats_job(self):
+        """Start the query computing every dashboard statistic at once"""
+        query = f"""
+        WITH attempts AS (
+            SELECT
                 COUNT(*) as total_attempts,
                 COUNTIF(access_granted = TRUE) as successful_attempts
             FROM `{self.get_table_ref('AccessLog')}`
             WHERE DATE(timestamp) = CURRENT_DATE()
-            """
-            attempts_stats = next(self.client.query(today_attempts_query).result())
-
-            # Query for gates status
-            gates_status_query = f"""
-            SELECT 
+        ),
+        gates AS (
+            SELECT
                 COUNT(*) as total_gates,
                 COUNTIF(status = 'online') as online_gates
             FROM `{self.get_table_ref('Gate')}`
-            """
-            gates_stats = next(self.client.query(gates_status_query).result())
+        )
+        SELECT
+            (SELECT COUNT(*) FROM `{self.get_table_ref('Vehicle')}` WHERE is_authorized = TRUE) as total_vehicles,
+            attempts.total_attempts,
+            attempts.successful_attempts,
+            gates.total_gates,
+            gates.online_gates
+        FROM attempts CROSS JOIN gates
+        """
+        return self.client.query(query)
 
+    def _dashboard_stats(self, stats_job):
+        """Read the stats row; stats_job is a started job or a callable starting one"""
+        try:
+            if callable(stats_job):
+                stats_job = stats_job()
+            row = next(iter(stats_job.result()))
             return {
-                'total_vehicles': vehicle_count,
-                'total_attempts_today': attempts_stats.total_attempts,
-                'successful_attempts_today': attempts_stats.successful_attempts,
-                'total_gates': gates_stats.total_gates,
-                'online_gates': gates_stats.online_gates
+                'total_vehicles': row.total_vehicles,
+                'total_attempts_today': row.total_attempts,
+                'successful_attempts_today': row.successful_attempts,
+                'total_gates': row.total_gates,
+                'online_gates': row.online_gates
             }
         except Exception as e:
             print(f"Error getting dashboard stats: {e}")
@@ -405,25 +634,114 @@ class BigQueryDB:
                 'online_gates': 0
             }
 
+    def get_dashboard_stats(self):
+        """Get statistics for the dashboard"""
+        return self._dashboard_stats(self._dashboard_stats_job)
+
+    def get_dashboard_data(self, log_limit=10):
+        """
+        Get the recent logs and the statistics shown on the dashboard.
+        Results are shared between requests for dashboard_cache_ttl seconds.
+
+        Returns:
+            tuple: (recent log rows, stats dict)
+        """
+        return self._dashboard_cache.get_or_load(log_limit, lambda: self._load_dashboard_data(log_limit))
+
+    def _load_dashboard_data(self, log_limit):
+        # Start both jobs before waiting on either so BigQuery runs them concurrently
+        logs_job = self.client.query(
+            f"""
+            SELECT * FROM `{self.get_table_ref('AccessLog')}`
+            ORDER BY timestamp DESC
+            LIMIT @limit
+            """,
+            job_config=bigquery.QueryJobConfig(
+                query_parameters=[
+                    bigquery.ScalarQueryParameter("limit", "INTEGER", log_limit)
+                ]
+            )
+        )
+        stats_job = self._dashboard_stats_job()
+
+        recent_logs = list(logs_job.result())
+        stats = self._dashboard_stats(stats_job)
+        return recent_logs, stats
+
     def get_sync_info(self):
-        """Get the current sync information for vehicles"""
+        """
+        Get the current sync information for vehicles.
+        The sync version is the time of the latest vehicle change or deletion
+        in microseconds since epoch, so it only ever grows. The result is
+        cached for sync_info_ttl seconds and shared by concurrent callers.
+
+        Raises:
+            Exception: BigQuery could not be read; nothing is cached
+        """
+        return self._sync_info_cache.get_or_load('Vehicle', self._query_sync_info)
+
+    def _query_sync_info(self):
         try:
             query = f"""
-            SELECT MAX(CAST(last_sync as STRING)) as max_sync,
-                   COUNT(*) as total_vehicles
-            FROM `{self.get_table_ref('Vehicle')}`
+            SELECT
+                (SELECT MAX(last_sync) FROM `{self.get_table_ref('Vehicle')}`) as max_sync,
+                (SELECT MAX(deleted_at) FROM `{self.get_table_ref('VehicleTombstone')}`) as max_deleted,
+                (SELECT COUNT(*) FROM `{self.get_table_ref('Vehicle')}`) as total_vehicles
             """
             result = next(self.client.query(query).result())
-            
-            # Use the hash of last_sync and total vehicles as version
-            sync_version = hash(f"{result.max_sync}_{result.total_vehicles}") % 1000000
+
+            changes = [dt for dt in (result.max_sync, result.max_deleted) if dt is not None]
+            last_change = max(changes) if changes else None
+            sync_version = _datetime_to_micros(last_change) if last_change else 0
             return {
                 'sync_version': sync_version,
-                'last_sync': result.max_sync
+                'last_sync': last_change.isoformat() if last_change else None,
+                'total_vehicles': result.total_vehicles
             }
         except Exception as e:
+            # Raised rather than reported as version 0, which would be cached
+            # and send every gate a full snapshot
             print(f"Error getting sync info: {e}")
-            return {
-                'sync_version': 0,
-                'last_sync': datetime.utcnow().isoformat()
-            }
\ No newline at end of file
+            raise
+
+
+def _datetime_to_micros(value):
+    """
+    Convert a naive BigQuery DATETIME to microseconds since epoch.
+    Vehicle.last_sync and VehicleTombstone.deleted_at are both written in
+    the server's local time; the value is read as UTC only to order them.
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def _keyset_condition(columns, op, start=0):
+    """Build `(a, b, c) op (@k0, @k1, @k2)` as nested comparisons"""
+    column = columns[start]
+    param = f"@k{start}"
+    if start == len(columns) - 1:
+        return f"{column} {op} {param}"
+    return f"({column} {op} {param} OR ({column} = {param} AND {_keyset_condition(columns, op, start + 1)}))"
+
+
+def _encode_cursor(keys, row, direction):
+    values = []
+    for name, _ in keys:
+        value = row[name]
+        values.append(value.isoformat() if isinstance(value, datetime) else value)
+    data = json.dumps({'k': values, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor, key_count):
+    """Decode a page cursor, returning None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if len(data['k']) != key_count or data['d'] not in ('next', 'prev'):
+            return None
+        return data
+    except (ValueError, KeyError, TypeError):
+        return None
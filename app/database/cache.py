@@ -0,0 +1,79 @@
+import threading
+import time
+
+
+class TTLCache:
+    """Thread-safe key/value cache whose entries expire ttl seconds after being set"""
+
+    def __init__(self, ttl, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = {}  # key -> (expires_at, value)
+        self._loading = {}  # key -> Event set when the running load finishes
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.maxsize:
+                self._evict()
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, key=None):
+        """Drop one key, or every entry when key is None"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def get_or_load(self, key, loader):
+        """
+        Get a cached value, calling loader() and caching its result on a miss.
+
+        Concurrent misses on the same key share a single loader() call: the
+        first caller loads, the others wait for it and read its result.
+        """
+        while True:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+            with self._lock:
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    break
+            # If the running load fails nothing is cached and one of the
+            # waiters takes over on the next pass
+            loading.wait()
+
+        try:
+            value = loader()
+            self.set(key, value)
+            return value
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading.set()
+
+    def _evict(self):
+        # Drop expired entries first, then the oldest inserted one
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
+        if len(self._entries) >= self.maxsize:
+            del self._entries[next(iter(self._entries))]
+
+
+_MISSING = object()
@@ -126,25 +126,45 @@ class Pagination:
         """Helper function to generate page numbers for pagination"""
         last = 0
         for num in range(1, self.pages + 1):
-            # If num is within left_edge pages from start
-            if num <= left_edge:
-                yield num
-                last = num
-            # If num is within left_current pages before current page
-            elif num > self.page - left_current - 1 and num < self.page + right_current:
-                if last + 1 != num:
-                    yield None
-                yield num
-                last = num
-            # If num is within right_edge pages from end
-            elif num > self.pages - right_edge:
-                if last + 1 != num:
+            # Pages at both edges and around the current page are shown,
+            # None marks a gap between them
+            if (num <= left_edge
+                    or self.page - left_current - 1 < num < self.page + right_current
+                    or num > self.pages - right_edge):
+                if last + 2 == num:
+                    # A gap of a single page shows that page instead
+                    yield last + 1
+                elif last + 1 != num:
                     yield None
                 yield num
                 last = num
-            elif last + 1 < num:
-                yield None
-                last = None
+
+class CursorPagination:
+    """Page of a keyset-paginated listing, addressed by opaque cursors"""
+    def __init__(self, items, page, per_page, total, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.pages = max((total + per_page - 1) // per_page, 1)
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def prev_num(self):
+        return max(self.page - 1, 1)
+
+    @property
+    def next_num(self):
+        return self.page + 1
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -0,0 +1,200 @@
+import threading
+import uuid
+from datetime import datetime
+
+from .vehicle_index import VehicleIndex
+
+
+def _row_to_dict(row):
+    return dict(row.items()) if hasattr(row, 'items') else dict(row)
+
+
+class LocalReplica:
+    """
+    In-memory copy of the Vehicle and Gate tables for the web app.
+
+    Loaded from BigQuery at startup, updated write-through by every change
+    made from this app and reconciled against BigQuery every
+    reconcile_interval seconds to pick up changes made elsewhere. Reads never
+    go to BigQuery once the replica is loaded.
+    """
+
+    def __init__(self, db, reconcile_interval=300):
+        self.db = db
+        self.reconcile_interval = reconcile_interval
+        self._vehicles = {}  # plate_number -> row dict
+        self._gates = {}     # gate_id -> row dict
+        self._loaded = False
+        # Bumped by every write-through so a reconcile that raced with one is discarded
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._index = VehicleIndex(self.list_vehicles, ttl=reconcile_interval)
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Loading
+    def load(self):
+        """Replace the replica with the current BigQuery tables"""
+        with self._lock:
+            generation = self._generation
+        vehicles = self.db.list_vehicles()
+        gates = self.db.list_gates()
+        with self._lock:
+            if self._loaded and generation != self._generation:
+                print("Replica changed during reconcile, retrying on the next run")
+                return False
+            self._vehicles = {row['plate_number']: _row_to_dict(row) for row in vehicles}
+            self._gates = {row['gate_id']: _row_to_dict(row) for row in gates}
+            self._loaded = True
+        self._index.invalidate()
+        return True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def _changed(self):
+        # Called with the lock held
+        self._generation += 1
+        self._index.invalidate()
+
+    # Vehicle reads
+    def get_vehicle(self, plate_number):
+        self._ensure_loaded()
+        with self._lock:
+            vehicle = self._vehicles.get(plate_number)
+            return dict(vehicle) if vehicle else None
+
+    def list_vehicles(self):
+        self._ensure_loaded()
+        with self._lock:
+            return [dict(vehicle) for vehicle in self._vehicles.values()]
+
+    def search_vehicles(self, prefix='', page=1, per_page=50):
+        """
+        Get one page of vehicles whose plate starts with prefix, sorted by plate
+
+        Returns:
+            tuple: (vehicle dicts on the page, total number of matching vehicles)
+        """
+        return self._index.search(prefix, page, per_page)
+
+    def iter_vehicles(self, prefix=''):
+        """Yield every vehicle whose plate starts with prefix, sorted by plate"""
+        return self._index.iter_matches(prefix)
+
+    # Vehicle writes
+    def add_vehicle(self, plate_number, owner_name, valid_from, valid_until=None, is_authorized=True):
+        row_id = str(uuid.uuid4())
+        success, errors = self.db.add_vehicle(plate_number, owner_name, valid_from, valid_until,
+                                              is_authorized, row_id=row_id)
+        if success:
+            with self._lock:
+                self._vehicles[plate_number] = {
+                    'id': row_id,
+                    'plate_number': plate_number,
+                    'owner_name': owner_name,
+                    'is_authorized': is_authorized,
+                    'valid_from': valid_from,
+                    'valid_until': valid_until,
+                    'last_sync': datetime.now()
+                }
+                self._changed()
+        return success, errors
+
+    def update_vehicle(self, plate_number, owner_name, is_authorized, valid_from, valid_until=None):
+        success, error = self.db.update_vehicle(plate_number, owner_name, is_authorized, valid_from, valid_until)
+        if success:
+            with self._lock:
+                vehicle = self._vehicles.get(plate_number)
+                if vehicle is not None:
+                    vehicle.update({
+                        'owner_name': owner_name,
+                        'is_authorized': is_authorized,
+                        'valid_from': valid_from,
+                        'valid_until': valid_until or None,
+                        'last_sync': datetime.now()
+                    })
+                self._changed()
+        return success, error
+
+    def delete_vehicle(self, plate_number):
+        success, error = self.db.delete_vehicle(plate_number)
+        if success:
+            with self._lock:
+                self._vehicles.pop(plate_number, None)
+                self._changed()
+        return success, error
+
+    # Gate reads
+    def get_gate(self, gate_id):
+        self._ensure_loaded()
+        with self._lock:
+            gate = self._gates.get(gate_id)
+            return dict(gate) if gate else None
+
+    def list_gates(self):
+        self._ensure_loaded()
+        with self._lock:
+            return [dict(gate) for gate in self._gates.values()]
+
+    # Gate writes
+    def add_gate(self, gate_id, location, status='offline', last_online=None):
+        row_id = str(uuid.uuid4())
+        success, errors = self.db.add_gate(gate_id, location, row_id=row_id, status=status,
+                                           last_online=last_online)
+        if success:
+            with self._lock:
+                self._gates[gate_id] = {
+                    'id': row_id,
+                    'gate_id': gate_id,
+                    'location': location,
+                    'last_online': last_online,
+                    'status': status,
+                    'local_cache_updated': None
+                }
+                self._changed()
+        return success, errors
+
+    def delete_gate(self, id):
+        """Delete a gate by its row ID"""
+        success = self.db.delete_gate(id)
+        if success:
+            with self._lock:
+                for gate_id, gate in list(self._gates.items()):
+                    if gate.get('id') == id:
+                        del self._gates[gate_id]
+                self._changed()
+        return success
+
+    def sync_gate(self, gate_id):
+        success = self.db.sync_gate(gate_id)
+        if success:
+            with self._lock:
+                gate = self._gates.get(gate_id)
+                if gate is not None:
+                    gate['local_cache_updated'] = datetime.now()
+                self._changed()
+        return success
+
+    # Reconciliation
+    def start(self):
+        """Start the background reconcile thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='replica-reconcile', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.reconcile_interval):
+            try:
+                self.load()
+            except Exception as e:
+                print(f"Error reconciling local replica: {e}")
@@ -2,18 +2,76 @@ import sqlite3
 from datetime import datetime, timedelta
 import uuid
 import os
+import threading
+import time
 import pytz
+from .vehicle_cache import AuthorizedVehicleCache
 
 # Configurar la zona horaria de España
 TIMEZONE = pytz.timezone('Europe/Madrid')
 
+# Schema of the vehicles table, shared with the shadow table of full syncs
+VEHICLES_TABLE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS {table} (
+    plate_number TEXT PRIMARY KEY,
+    owner_name TEXT,
+    valid_from DATETIME,
+    valid_until DATETIME,
+    is_authorized BOOLEAN DEFAULT TRUE,
+    last_sync DATETIME
+)'''
+
+VEHICLES_INSERT = '''
+INSERT OR REPLACE INTO {table}
+(plate_number, owner_name, valid_from, valid_until, is_authorized, last_sync)
+VALUES (?, ?, ?, ?, ?, ?)'''
+
 class SQLiteDB:
-    def __init__(self, db_path):
+    def __init__(self, db_path, cache_size_kb=8192, synchronous='NORMAL', busy_timeout=5.0,
+                 vehicle_cache_check_interval=5.0):
         """Initialize SQLite database"""
         self.db_path = db_path
+        self.cache_size_kb = cache_size_kb
+        self.synchronous = synchronous
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
         self._ensure_db_dir()
         self._init_db()
 
+        # Authorized vehicles kept in memory. update_vehicles reloads it at
+        # once; changes made by another process are picked up through
+        # vehicle_data_version at most every vehicle_cache_check_interval
+        self.vehicle_cache = AuthorizedVehicleCache()
+        self.vehicle_cache_check_interval = vehicle_cache_check_interval
+        self._vehicle_cache_checked_at = 0.0
+        self.reload_vehicle_cache()
+
+    def _get_connection(self):
+        """
+        Get the calling thread's connection, opening it on first use.
+        Connections stay open so the statement cache of each connection is
+        reused across calls. Use it as `with self._get_connection() as conn:`
+        to commit (or roll back) the statements run inside the block.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, cached_statements=256)
+            conn.row_factory = sqlite3.Row
+            # WAL lets readers run while a sync is writing; NORMAL sync is safe in WAL mode
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(f'PRAGMA synchronous={self.synchronous}')
+            conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+            conn.execute('PRAGMA temp_store=MEMORY')
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """Close the calling thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
     def _ensure_db_dir(self):
         """Ensure database directory exists"""
         db_dir = os.path.dirname(self.db_path)
@@ -23,17 +81,9 @@ class SQLiteDB:
     def _init_db(self):
         """Initialize database with schema"""
         self._ensure_db_dir()  # Asegurarnos de que el directorio existe
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_connection() as conn:
             # Create vehicles table
-            conn.execute('''
-            CREATE TABLE IF NOT EXISTS authorized_vehicles (
-                plate_number TEXT PRIMARY KEY,
-                owner_name TEXT,
-                valid_from DATETIME,
-                valid_until DATETIME,
-                is_authorized BOOLEAN DEFAULT TRUE,
-                last_sync DATETIME
-            )''')
+            conn.execute(VEHICLES_TABLE_SCHEMA.format(table='authorized_vehicles'))
 
             # Create access logs table for storing pending logs
             conn.execute('''
@@ -49,6 +99,16 @@ class SQLiteDB:
                 retry_count INTEGER DEFAULT 0
             )''')
 
+            # Create presence table: latest in/out state of every plate, kept
+            # up to date by create_access_log so lookups don't scan the logs
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS vehicle_presence (
+                plate_number TEXT PRIMARY KEY,
+                accessing BOOLEAN DEFAULT FALSE,
+                last_log_id TEXT,
+                updated_at DATETIME
+            )''')
+
             # Create sync control table
             conn.execute('''
             CREATE TABLE IF NOT EXISTS sync_control (
@@ -57,6 +117,14 @@ class SQLiteDB:
                 sync_version INTEGER DEFAULT 0
             )''')
 
+            # Create vehicle data version table, bumped on every vehicle change
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS vehicle_data_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER DEFAULT 0
+            )''')
+            conn.execute('INSERT OR IGNORE INTO vehicle_data_version (id, version) VALUES (1, 0)')
+
             # Initialize sync control if not exists
             conn.execute('''
             INSERT OR IGNORE INTO sync_control (id, last_sync, sync_version)
@@ -66,11 +134,22 @@ class SQLiteDB:
             # Create indices for better performance
             conn.execute('CREATE INDEX IF NOT EXISTS idx_plate ON authorized_vehicles(plate_number)')
             conn.execute('CREATE INDEX IF NOT EXISTS idx_sync_status ON pending_logs(sync_status)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_plate_timestamp ON pending_logs(plate_number, timestamp)')
+
+            # Backfill presence for plates logged before the table existed
+            conn.execute('''
+            INSERT OR IGNORE INTO vehicle_presence (plate_number, accessing, last_log_id, updated_at)
+            SELECT plate_number, accessing, id, timestamp
+            FROM pending_logs AS log
+            WHERE timestamp = (
+                SELECT MAX(timestamp) FROM pending_logs
+                WHERE plate_number = log.plate_number
+            )
+            ''')
 
     def get_vehicle_by_plate_number(self, plate_number):
         """Get vehicle details by plate number"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        with self._get_connection() as conn:
             cursor = conn.execute('''
                 SELECT * FROM authorized_vehicles 
                 WHERE plate_number = ?
@@ -78,37 +157,64 @@ class SQLiteDB:
             vehicle = cursor.fetchone()
             return vehicle if vehicle else None
 
+    def reload_vehicle_cache(self):
+        """Load the authorized vehicles into the in-memory cache"""
+        with self.vehicle_cache.lock:
+            with self._get_connection() as conn:
+                # One read transaction so version and rows come from the same snapshot
+                conn.execute('BEGIN')
+                version = conn.execute('SELECT version FROM vehicle_data_version WHERE id = 1').fetchone()['version']
+                rows = conn.execute('''
+                    SELECT plate_number, owner_name, is_authorized, valid_from, valid_until
+                    FROM authorized_vehicles
+                ''').fetchall()
+            self.vehicle_cache.load(rows, version)
+            self._vehicle_cache_checked_at = time.monotonic()
+
+    def _refresh_vehicle_cache(self):
+        """Reload the vehicle cache if another process changed the vehicles"""
+        if not self.vehicle_cache.loaded:
+            self.reload_vehicle_cache()
+            return
+        if time.monotonic() - self._vehicle_cache_checked_at < self.vehicle_cache_check_interval:
+            return
+
+        with self._get_connection() as conn:
+            version = conn.execute('SELECT version FROM vehicle_data_version WHERE id = 1').fetchone()['version']
+        self._vehicle_cache_checked_at = time.monotonic()
+        if version != self.vehicle_cache.version:
+            self.reload_vehicle_cache()
+
+    def get_authorized_vehicle(self, plate_number):
+        """
+        Get a vehicle from the in-memory cache
+
+        Returns:
+            CachedVehicle: Vehicle with parsed validity dates, or None if unknown
+        """
+        self._refresh_vehicle_cache()
+        return self.vehicle_cache.get(plate_number)
+
     def get_vehicle_last_sync_time(self):
         """Get the last sync time of the vehicle database"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row  # para acceder por nombre de columna
+        with self._get_connection() as conn:
             cursor = conn.execute('SELECT last_sync FROM authorized_vehicles ORDER BY last_sync DESC LIMIT 1')
             result = cursor.fetchone()
             return result['last_sync'] if result else None
 
     def is_vehicle_in_parking(self, plate_number):
         """Check if a vehicle is currently in parking"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        with self._get_connection() as conn:
             cursor = conn.execute('''
-                SELECT * FROM pending_logs 
+                SELECT accessing FROM vehicle_presence
                 WHERE plate_number = ?
-                ORDER BY timestamp DESC
             ''', (plate_number,))
-            vehicle = cursor.fetchone()
-
-            if vehicle:
-                print("DEBUG: vehicle instance:", vehicle['timestamp'], vehicle['accessing'])  # Debugging line
-                accessing = vehicle['accessing'] if vehicle and vehicle['accessing'] else False
-
-                return accessing
-
-            return False
+            presence = cursor.fetchone()
+            return bool(presence['accessing']) if presence else False
         
     def is_vehicle_authorized(self, plate_number):
         """Check if a vehicle is authorized"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        with self._get_connection() as conn:
             cursor = conn.execute('''
                 SELECT is_authorized, valid_from, valid_until 
                 FROM authorized_vehicles 
@@ -139,19 +245,23 @@ class SQLiteDB:
 
     def create_access_log(self, plate_number, gate_id, access_granted, accessing, confidence_score=None):
         """Create a new access log entry for later synchronization"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_connection() as conn:
             log_id = str(uuid.uuid4())
             now = datetime.now(TIMEZONE)
             conn.execute('''
                 INSERT INTO pending_logs (id, plate_number, gate_id, access_granted, confidence_score, timestamp, accessing)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
             ''', (log_id, plate_number, gate_id, access_granted, confidence_score, now.isoformat(), accessing))
+            # Same transaction: the presence row never disagrees with the logs
+            conn.execute('''
+                INSERT OR REPLACE INTO vehicle_presence (plate_number, accessing, last_log_id, updated_at)
+                VALUES (?, ?, ?, ?)
+            ''', (plate_number, accessing, log_id, now.isoformat()))
             return log_id
 
     def get_pending_logs(self, limit=50, max_retries=3):
         """Get logs that need to be synchronized"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        with self._get_connection() as conn:
             cursor = conn.execute('''
                 SELECT * FROM pending_logs
                 WHERE sync_status = 'pending'
@@ -165,7 +275,7 @@ class SQLiteDB:
         """Update the local sync version"""
         try:
             sync_version = int(new_version)
-            with sqlite3.connect(self.db_path) as conn:
+            with self._get_connection() as conn:
                 conn.execute('''
                     UPDATE sync_control
                     SET sync_version = ?, last_sync = CURRENT_TIMESTAMP
@@ -177,31 +287,80 @@ class SQLiteDB:
 
     def get_sync_info(self):
         """Get current sync version and timestamp"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        with self._get_connection() as conn:
             cursor = conn.execute('SELECT * FROM sync_control WHERE id = 1')
             return cursor.fetchone()    
             
-    def update_vehicles(self, vehicles):
-        """Update local vehicle database from sync data"""
-        with sqlite3.connect(self.db_path) as conn:
-            for vehicle in vehicles:
-                conn.execute('''
-                    INSERT OR REPLACE INTO authorized_vehicles 
-                    (plate_number, owner_name, valid_from, valid_until, is_authorized, last_sync)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    vehicle['plate_number'],
-                    vehicle.get('owner_name', ''),
-                    vehicle['valid_from'],
-                    vehicle['valid_until'],
-                    vehicle['is_authorized'],
-                    datetime.now(TIMEZONE).isoformat()
-                ))
+    @staticmethod
+    def _vehicle_rows(vehicles, synced_at):
+        return [(
+            vehicle['plate_number'],
+            vehicle.get('owner_name', ''),
+            vehicle['valid_from'],
+            vehicle['valid_until'],
+            vehicle['is_authorized'],
+            synced_at
+        ) for vehicle in vehicles]
+
+    @staticmethod
+    def _swap_in_shadow_table(conn):
+        """Replace authorized_vehicles with the shadow table (inside a transaction)"""
+        conn.execute('DROP TABLE authorized_vehicles')
+        conn.execute('ALTER TABLE authorized_vehicles_shadow RENAME TO authorized_vehicles')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_plate ON authorized_vehicles(plate_number)')
+        conn.execute('UPDATE vehicle_data_version SET version = version + 1 WHERE id = 1')
+
+    def update_vehicles(self, vehicles, replace=False, deleted=None):
+        """
+        Update local vehicle database from sync data
+
+        Args:
+            vehicles (list): Vehicle dicts from the sync payload
+            replace (bool): The payload is a full snapshot that replaces the
+                whole table instead of being upserted into it
+            deleted (list): Plate numbers to remove (delta syncs)
+        """
+        rows = self._vehicle_rows(vehicles, datetime.now(TIMEZONE).isoformat())
+
+        with self._get_connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if replace:
+                # Load a shadow table and swap it in. Readers keep seeing the
+                # old table until the transaction commits.
+                conn.execute('DROP TABLE IF EXISTS authorized_vehicles_shadow')
+                conn.execute(VEHICLES_TABLE_SCHEMA.format(table='authorized_vehicles_shadow'))
+                conn.executemany(VEHICLES_INSERT.format(table='authorized_vehicles_shadow'), rows)
+                self._swap_in_shadow_table(conn)
+            else:
+                if deleted:
+                    conn.executemany('DELETE FROM authorized_vehicles WHERE plate_number = ?',
+                                     [(plate_number,) for plate_number in deleted])
+                conn.executemany(VEHICLES_INSERT.format(table='authorized_vehicles'), rows)
+                conn.execute('UPDATE vehicle_data_version SET version = version + 1 WHERE id = 1')
+        self.reload_vehicle_cache()
+
+    def begin_vehicle_snapshot(self):
+        """Start loading a chunked snapshot into an empty shadow table"""
+        with self._get_connection() as conn:
+            conn.execute('DROP TABLE IF EXISTS authorized_vehicles_shadow')
+            conn.execute(VEHICLES_TABLE_SCHEMA.format(table='authorized_vehicles_shadow'))
+
+    def add_snapshot_vehicles(self, vehicles):
+        """Store one chunk of a snapshot in the shadow table"""
+        rows = self._vehicle_rows(vehicles, datetime.now(TIMEZONE).isoformat())
+        with self._get_connection() as conn:
+            conn.executemany(VEHICLES_INSERT.format(table='authorized_vehicles_shadow'), rows)
+
+    def finish_vehicle_snapshot(self):
+        """Replace the vehicles with the completed shadow table"""
+        with self._get_connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            self._swap_in_shadow_table(conn)
+        self.reload_vehicle_cache()
 
     def mark_logs_synced(self, log_ids):
         """Mark logs as successfully synchronized"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_connection() as conn:
             log_ids_str = ','.join(['?'] * len(log_ids))
             conn.execute(f'''
                 UPDATE pending_logs 
@@ -211,7 +370,7 @@ class SQLiteDB:
 
     def increment_retry_count(self, log_ids):
         """Increment retry count for failed sync attempts"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_connection() as conn:
             log_ids_str = ','.join(['?'] * len(log_ids))
             conn.execute(f'''
                 UPDATE pending_logs 
@@ -221,7 +380,7 @@ class SQLiteDB:
 
     def clean_old_logs(self, days=7):
         """Remove old synced logs (SAFE)"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_connection() as conn:
             # Calcular la fecha límite en Python y formatearla
             limit_date = datetime.now() - timedelta(days=days)
             limit_date_str = limit_date.strftime('%Y-%m-%d %H:%M:%S')
@@ -0,0 +1,84 @@
+from collections import namedtuple
+from datetime import datetime
+import threading
+
+
+def _parse_datetime(value):
+    """Parse a stored ISO date into a naive local datetime"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+
+class CachedVehicle(namedtuple('CachedVehicle', [
+        'plate_number', 'owner_name', 'is_authorized', 'valid_from', 'valid_until'])):
+    """Authorized vehicle with its validity window already parsed"""
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            plate_number=row['plate_number'],
+            owner_name=row['owner_name'],
+            is_authorized=bool(row['is_authorized']),
+            valid_from=_parse_datetime(row['valid_from']),
+            valid_until=_parse_datetime(row['valid_until'])
+        )
+
+    def is_currently_valid(self, now=None):
+        if not self.is_authorized:
+            return False
+
+        now = now or datetime.now()
+        if self.valid_from is not None and now < self.valid_from:
+            return False
+        if self.valid_until is not None and now > self.valid_until:
+            return False
+        return True
+
+
+class AuthorizedVehicleCache:
+    """
+    In-memory copy of the authorized_vehicles table.
+
+    The whole table is replaced at once on load(), so a lookup always sees
+    either the old or the new vehicle set, never a mix of both.
+    """
+
+    def __init__(self):
+        self._vehicles = None
+        self.version = None
+        self.lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._vehicles is not None
+
+    def load(self, rows, version):
+        """Replace the cached vehicles with the given rows"""
+        vehicles = {}
+        for row in rows:
+            try:
+                vehicle = CachedVehicle.from_row(row)
+            except (ValueError, TypeError) as e:
+                print(f"Skipping vehicle {row['plate_number']} with invalid dates: {e}")
+                continue
+            vehicles[vehicle.plate_number] = vehicle
+        self._vehicles = vehicles
+        self.version = version
+
+    def invalidate(self):
+        self._vehicles = None
+        self.version = None
+
+    def get(self, plate_number):
+        vehicles = self._vehicles
+        return vehicles.get(plate_number) if vehicles is not None else None
+
+    def __len__(self):
+        vehicles = self._vehicles
+        return len(vehicles) if vehicles is not None else 0
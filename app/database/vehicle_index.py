@@ -0,0 +1,64 @@
+import bisect
+import threading
+import time
+
+
+class VehicleIndex:
+    """
+    Local copy of the vehicle table sorted by plate number.
+
+    Rows come from loader() and are kept for ttl seconds or until
+    invalidate() is called. Plate-prefix searches are two binary searches
+    over the sorted plates, and a page is a slice of the result, so a
+    listing never touches more rows than it shows.
+    """
+
+    def __init__(self, loader, ttl=60):
+        self.loader = loader
+        self.ttl = ttl
+        # (upper-cased plates sorted, rows in the same order), swapped as a whole
+        self._index = ([], [])
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._expires_at = 0.0
+
+    def _ensure_fresh(self):
+        if time.monotonic() < self._expires_at:
+            return
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            if time.monotonic() < self._expires_at:
+                return
+            rows = sorted(self.loader(), key=lambda row: row['plate_number'].upper())
+            self._index = ([row['plate_number'].upper() for row in rows], rows)
+            self._expires_at = time.monotonic() + self.ttl
+
+    def _range(self, prefix):
+        keys, rows = self._index
+        prefix = (prefix or '').strip().upper()
+        if not prefix:
+            return rows, 0, len(rows)
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + '\uffff', start)
+        return rows, start, end
+
+    def search(self, prefix='', page=1, per_page=50):
+        """
+        Get one page of vehicles whose plate starts with prefix
+
+        Returns:
+            tuple: (rows on the page, total number of matching vehicles)
+        """
+        self._ensure_fresh()
+        rows, start, end = self._range(prefix)
+        first = start + (max(page, 1) - 1) * per_page
+        return rows[first:min(first + per_page, end)], end - start
+
+    def iter_matches(self, prefix=''):
+        """Yield every vehicle whose plate starts with prefix, in plate order"""
+        self._ensure_fresh()
+        rows, start, end = self._range(prefix)
+        for index in range(start, end):
+            yield rows[index]
@@ -0,0 +1,142 @@
+import queue
+import threading
+import time
+import zlib
+
+# Overload policies applied when a worker queue is full
+OVERLOAD_DROP_OLDEST = 'drop_oldest'  # Discard the oldest queued message to make room
+OVERLOAD_DROP_NEWEST = 'drop_newest'  # Reject the incoming message
+OVERLOAD_POLICIES = (OVERLOAD_DROP_OLDEST, OVERLOAD_DROP_NEWEST)
+
+_STOP = object()
+
+
+class MessageDispatcher:
+    """
+    Runs MQTT message handlers on a pool of worker threads.
+
+    Every worker owns a bounded queue. Messages are routed to a worker by
+    hashing their key (the gate id), so messages from the same gate are
+    handled in arrival order while different gates are handled in parallel.
+    """
+
+    def __init__(self, num_workers=4, queue_size=100, overload_policy=OVERLOAD_DROP_OLDEST, name='mqtt-worker'):
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+        if overload_policy not in OVERLOAD_POLICIES:
+            raise ValueError(f"Unknown overload policy: {overload_policy}")
+
+        self.num_workers = num_workers
+        self.queue_size = queue_size
+        self.overload_policy = overload_policy
+        self.name = name
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(num_workers)]
+        self._threads = []
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._processed = 0
+        self._failed = 0
+        self._dropped = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def start(self):
+        """Start the worker threads"""
+        if self._threads:
+            return
+        for index, worker_queue in enumerate(self._queues):
+            thread = threading.Thread(
+                target=self._worker,
+                args=(worker_queue,),
+                name=f"{self.name}-{index}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Stop the workers once they have drained their queues"""
+        for worker_queue in self._queues:
+            worker_queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, key, handler, *args):
+        """
+        Queue handler(*args) on the worker that owns key
+
+        Returns:
+            bool: False if the message was dropped because the worker queue was full
+        """
+        worker_queue = self._queues[zlib.crc32(key.encode('utf-8')) % self.num_workers]
+        item = (time.monotonic(), handler, args)
+
+        with self._lock:
+            self._submitted += 1
+
+        try:
+            worker_queue.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+
+        if self.overload_policy == OVERLOAD_DROP_OLDEST:
+            try:
+                worker_queue.get_nowait()
+                self._record_drop(key, 'oldest')
+                worker_queue.put_nowait(item)
+                return True
+            except (queue.Empty, queue.Full):
+                pass
+
+        self._record_drop(key, 'newest')
+        return False
+
+    def stats(self):
+        """Get queue depth and wait time metrics"""
+        depths = [worker_queue.qsize() for worker_queue in self._queues]
+        with self._lock:
+            processed = self._processed
+            return {
+                'workers': self.num_workers,
+                'queue_size': self.queue_size,
+                'overload_policy': self.overload_policy,
+                'queue_depth': sum(depths),
+                'queue_depth_per_worker': depths,
+                'submitted': self._submitted,
+                'processed': processed,
+                'failed': self._failed,
+                'dropped': self._dropped,
+                'avg_wait_ms': (self._total_wait / processed * 1000) if processed else 0.0,
+                'max_wait_ms': self._max_wait * 1000
+            }
+
+    def _record_drop(self, key, which):
+        with self._lock:
+            self._dropped += 1
+        print(f"Dispatcher overloaded, dropped {which} message for {key}")
+
+    def _worker(self, worker_queue):
+        while True:
+            item = worker_queue.get()
+            if item is _STOP:
+                break
+
+            enqueued_at, handler, args = item
+            wait = time.monotonic() - enqueued_at
+            failed = False
+            try:
+                handler(*args)
+            except Exception as e:
+                failed = True
+                print(f"Error in {threading.current_thread().name}: {e}")
+
+            with self._lock:
+                self._processed += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+                if failed:
+                    self._failed += 1
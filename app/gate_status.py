@@ -0,0 +1,158 @@
+import threading
+import time
+from datetime import datetime
+
+from .database.models import Gate
+
+
+class GateStatusRegistry:
+    """
+    In-memory registry of gate liveness.
+
+    Heartbeats update the registry immediately; changed gates are written to
+    BigQuery by a background thread every flush_interval seconds with a
+    single statement, so only the latest status of each gate is written per
+    interval.
+
+    BigQuery rejects UPDATE on rows still in the streaming buffer, so gates
+    created by this registry are left out of the flush for
+    streaming_buffer_window seconds; one of them would fail the whole batch.
+    """
+
+    def __init__(self, db, flush_interval=30, streaming_buffer_window=5400):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.streaming_buffer_window = streaming_buffer_window
+        self._gates = {}  # gate_id -> {'id', 'status', 'last_online', 'location', 'created'}
+        self._dirty = set()
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def load(self):
+        """(Re)load the known gates from BigQuery, keeping the live statuses"""
+        rows = self.db.list_gates()
+        with self._lock:
+            gates = {}
+            for row in rows:
+                gate = Gate(row)
+                entry = {
+                    'id': gate.id,
+                    'status': gate.status,
+                    'last_online': gate.last_online,
+                    'location': gate.location,
+                    'created': None
+                }
+                live = self._gates.get(gate.gate_id)
+                if live is not None:
+                    entry['status'] = live['status']
+                    entry['last_online'] = live['last_online']
+                    entry['created'] = live['created']
+                gates[gate.gate_id] = entry
+            self._gates = gates
+            self._dirty &= set(gates)
+            self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def update(self, gate_id, status):
+        """
+        Record a status heartbeat
+
+        Returns:
+            bool: False if the gate is unknown and has to be created first
+        """
+        self._ensure_loaded()
+        with self._lock:
+            entry = self._gates.get(gate_id)
+            if entry is None:
+                return False
+            entry['status'] = status
+            if status == 'online':
+                entry['last_online'] = datetime.now()
+            self._dirty.add(gate_id)
+            return True
+
+    def add(self, gate_id, location, status='offline', last_online=None):
+        """
+        Register a gate that was just created in BigQuery.
+        The insert already carries its status, so it is not marked dirty.
+        """
+        with self._lock:
+            self._gates[gate_id] = {
+                'id': None,
+                'status': status,
+                'last_online': last_online,
+                'location': location,
+                'created': time.monotonic()
+            }
+
+    def get(self, gate_id):
+        self._ensure_loaded()
+        with self._lock:
+            entry = self._gates.get(gate_id)
+            return dict(entry) if entry else None
+
+    def apply(self, gate):
+        """Overwrite the status of a Gate model with the live one"""
+        entry = self.get(gate.gate_id)
+        if entry:
+            gate.status = entry['status']
+            gate.last_online = entry['last_online']
+        return gate
+
+    def online_count(self):
+        self._ensure_loaded()
+        with self._lock:
+            return sum(1 for entry in self._gates.values() if entry['status'] == 'online')
+
+    def flush(self):
+        """Write the latest status of every changed gate to BigQuery"""
+        with self._lock:
+            # Gates still in the streaming buffer stay dirty until they can be updated
+            buffered_since = time.monotonic() - self.streaming_buffer_window
+            ready = {gate_id for gate_id in self._dirty
+                     if gate_id in self._gates and (self._gates[gate_id]['created'] or 0) <= buffered_since}
+            if not ready:
+                return True
+            updates = [{
+                'gate_id': gate_id,
+                'status': self._gates[gate_id]['status'],
+                'last_online': self._gates[gate_id]['last_online']
+            } for gate_id in ready]
+            self._dirty = {gate_id for gate_id in self._dirty - ready if gate_id in self._gates}
+
+        if self.db.update_gate_statuses(updates):
+            print(f"Flushed status of {len(updates)} gates")
+            return True
+
+        # Retry on the next flush
+        with self._lock:
+            self._dirty.update(update['gate_id'] for update in updates)
+        return False
+
+    def start(self):
+        """Start the background flush thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='gate-status-flush', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flush thread, writing pending changes first"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing gate statuses: {e}")
@@ -1,15 +1,20 @@
 import paho.mqtt.client as mqtt
 import json
+import zlib
 from datetime import datetime, timezone
 import base64
 import os
 from dotenv import load_dotenv
-import requests
 
 from .database.models import Gate, Vehicle, AccessLog
 from .database.bigquery_db import BigQueryDB
-from . import db
+from . import db, gate_registry, replica
 from .database.sqlite_db import SQLiteDB
+from .dispatcher import MessageDispatcher
+from .database.cache import TTLCache
+from .sync_format import choose_format, encode_sync_response
+from .recognition_cache import AccessDedupWindow, RecognitionCache
+from .anpr_client import ANPRClient, CircuitBreaker, CircuitOpenError, InProcessANPRBackend
 
 # Cargar variables de entorno
 load_dotenv()
@@ -20,61 +25,155 @@ sqlite = SQLiteDB(os.getenv('LOCAL_DATABASE_URL'))
 # MQTT Topics
 TOPIC_GATE_STATUS = "gate/+/status"
 TOPIC_GATE_ACCESS = "gate/+/access"
+TOPIC_GATE_ACCESS_RAW = "gate/+/access/raw"  # JPEG bytes as the whole payload
 TOPIC_GATE_SYNC = "gate/+/sync"
 TOPIC_SERVER_RESPONSE = "server/response/{gate_id}"
 
 TOPIC_GATE_SYNC_REQUEST = "gate/+/sync/request"
 TOPIC_GATE_SYNC_RESPONSE = "gate/{gate_id}/sync/response"
+TOPIC_GATE_SYNC_CHUNK = "gate/{gate_id}/sync/chunk"
 TOPIC_GATE_SYNC_LOGS = "gate/+/sync/logs"
 TOPIC_GATE_SYNC_LOGS_ACK = "gate/{gate_id}/sync/logs/ack"
 
 # YOLO API Configuration
+# ANPR backend: 'http' calls the YOLO service, 'inprocess' runs its pipeline in this process
+ANPR_BACKEND = os.getenv('ANPR_BACKEND', 'http')
+ANPR_PIPELINE_DIR = os.getenv('ANPR_PIPELINE_DIR', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'docker', 'yolo'))
 YOLO_API_URL = os.getenv('YOLO_API_URL')
+YOLO_CONNECT_TIMEOUT = float(os.getenv('YOLO_CONNECT_TIMEOUT', 2))
+YOLO_READ_TIMEOUT = float(os.getenv('YOLO_READ_TIMEOUT', 10))
+YOLO_MAX_RETRIES = int(os.getenv('YOLO_MAX_RETRIES', 2))
+YOLO_BREAKER_THRESHOLD = int(os.getenv('YOLO_BREAKER_THRESHOLD', 5))
+YOLO_BREAKER_RESET = float(os.getenv('YOLO_BREAKER_RESET', 30))
+
+# Vehicle sync: changes this many seconds older than a gate's version are sent again
+SYNC_OVERLAP_SECONDS = int(os.getenv('SYNC_OVERLAP_SECONDS', 300))
+# Serialized sync responses are shared by gates asking for the same versions
+SYNC_PAYLOAD_CACHE_TTL = int(os.getenv('SYNC_PAYLOAD_CACHE_TTL', 60))
+# Vehicles per chunk for gates that ask for chunked transfers
+SYNC_CHUNK_SIZE = int(os.getenv('SYNC_CHUNK_SIZE', 1000))
+# Chunked transfers are kept for resumes this many seconds after the last request
+# for them; keep it above the gates' SYNC_CHUNK_TIMEOUT x SYNC_CHUNK_MAX_RETRIES
+SYNC_TRANSFER_TTL = int(os.getenv('SYNC_TRANSFER_TTL', 300))
+
+# Frames re-sent unchanged within RECOGNITION_CACHE_TTL seconds reuse the first ANPR result
+RECOGNITION_CACHE_TTL = int(os.getenv('RECOGNITION_CACHE_TTL', 10))
+# The same plate at the same gate within this many seconds is one arrival
+ACCESS_DEDUP_WINDOW = int(os.getenv('ACCESS_DEDUP_WINDOW', 15))
+
+# Message dispatcher configuration
+MQTT_WORKERS = int(os.getenv('MQTT_WORKERS', 4))
+MQTT_QUEUE_SIZE = int(os.getenv('MQTT_QUEUE_SIZE', 100))
+MQTT_OVERLOAD_POLICY = os.getenv('MQTT_OVERLOAD_POLICY', 'drop_oldest')
+# MQTT protocol of the server client: 5 delivers the user properties of raw access frames
+MQTT_PROTOCOL_VERSION = int(os.getenv('MQTT_PROTOCOL_VERSION', 4))
 
 # Global MQTT client
 mqtt_client = None
 
-def process_image_with_yolo(image_data, url=None):
+# Worker pool that runs the message handlers off the paho network thread
+dispatcher = None
+
+# Sync responses and their serialized payloads keyed by (mode, gate version, server version)
+sync_payload_cache = TTLCache(SYNC_PAYLOAD_CACHE_TTL, maxsize=32)
+# Chunked transfers by transfer_id, so a resume gets the exact chunks of its manifest
+sync_transfer_cache = TTLCache(SYNC_TRANSFER_TTL, maxsize=64)
+
+def create_anpr_client():
+    """Create the ANPR backend selected by ANPR_BACKEND"""
+    if ANPR_BACKEND == 'inprocess':
+        return InProcessANPRBackend(ANPR_PIPELINE_DIR)
+    if ANPR_BACKEND != 'http':
+        raise ValueError(f"Unknown ANPR_BACKEND {ANPR_BACKEND!r}, expected 'http' or 'inprocess'")
+    # One connection per handler worker
+    return ANPRClient(
+        YOLO_API_URL,
+        connect_timeout=YOLO_CONNECT_TIMEOUT,
+        read_timeout=YOLO_READ_TIMEOUT,
+        max_retries=YOLO_MAX_RETRIES,
+        pool_size=MQTT_WORKERS,
+        breaker=CircuitBreaker(YOLO_BREAKER_THRESHOLD, YOLO_BREAKER_RESET)
+    )
+
+# Shared ANPR backend used by every handler worker
+anpr_client = create_anpr_client()
+
+# Repeated camera frames and repeated detections of the same car
+recognition_cache = RecognitionCache(RECOGNITION_CACHE_TTL)
+access_dedup = AccessDedupWindow(ACCESS_DEDUP_WINDOW)
+
+# Plate texts reported when no plate could be read
+UNRECOGNIZED_PLATES = ('UNKNOWN', 'No plate detected')
+
+def is_recognized(plate_text, confidence):
+    """Whether an ANPR result actually read a plate"""
+    return plate_text not in UNRECOGNIZED_PLATES and bool(confidence)
+
+def process_image_with_yolo(image_data, url=None, gate_id=None):
     """
-    Process an image using the YOLO API service
+    Process an image with the configured ANPR backend
     
     Args:
         image_data (bytes): Raw image data in bytes
+        gate_id (str): Gate that sent the frame; enables the recognition cache
         
     Returns:
-        tuple: (plate_text, confidence) from the ANPR service
+        tuple: (plate_text, confidence) from the ANPR service, or
+        ('UNKNOWN', 0.0) if the service failed or its circuit is open
     """
+    if gate_id is None or url is not None:
+        return recognize_plate(image_data, url=url, gate_id=gate_id)
+
+    cached, digest = recognition_cache.get(gate_id, image_data)
+    if cached is not None:
+        print(f"Reusing ANPR result for a repeated frame from gate {gate_id}: {cached[0]}")
+        return cached
+
+    result = recognize_plate(image_data, gate_id=gate_id)
+    # Failures and misses are not cached so the next frame tries again
+    if is_recognized(*result):
+        recognition_cache.put(gate_id, digest, result)
+    return result
+
+def recognize_plate(image_data, url=None, gate_id=None):
+    """Run one frame through the ANPR backend"""
     try:
-        if url is None:
-            # Prepare the image file for the request
-            files = {'image': ('image.jpg', image_data, 'image/jpeg')}
-            
-            # Make request to YOLO API
-            response = requests.post(f"{YOLO_API_URL}/api/anpr", files=files)
-        else:
-            # Make request to YOLO API
+        if url is not None:
             print(f"Processing image from URL: {url}")
-            response = requests.get(f"{YOLO_API_URL}/api/anpr/url", params={'image': url})
-        
-        if response.status_code == 200:
-            result = response.json()
-            print(f"YOLO API Response: {result}")
-            return result['plate_text'], result['confidence']
-        else:
-            print(f"Error from YOLO API: {response.text}")
-            return 'UNKNOWN', 0.0
-               
+        plate_text, confidence = anpr_client.recognize(image_data, url=url, gate_id=gate_id)
+        print(f"ANPR result: {plate_text} ({confidence})")
+        return plate_text, confidence
+
+    except CircuitOpenError:
+        print("YOLO API circuit open, skipping recognition")
+        return 'UNKNOWN', 0.0
     except Exception as e:
-        print(f"Error processing image with YOLO API: {e}")
+        print(f"Error processing image with ANPR backend: {e}")
         return 'UNKNOWN', 0.0
 
 def init_mqtt(app):
     """Initialize MQTT with application context"""
-    global mqtt_client
+    global mqtt_client, dispatcher
     
     # Check if we're in the reloader process
     if os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
         return
+
+    # Load the models now rather than on the first frame
+    if isinstance(anpr_client, InProcessANPRBackend):
+        anpr_client.load()
+
+    # Start the handler workers before any message can arrive
+    dispatcher = MessageDispatcher(
+        num_workers=MQTT_WORKERS,
+        queue_size=MQTT_QUEUE_SIZE,
+        overload_policy=MQTT_OVERLOAD_POLICY
+    )
+    dispatcher.start()
+
+    # Flush heartbeats received through MQTT to BigQuery periodically
+    gate_registry.start()
     
     # Get MQTT configuration from environment
     broker_url = os.getenv('MQTT_BROKER_URL', 'localhost')
@@ -84,7 +183,8 @@ def init_mqtt(app):
     
     # Initialize MQTT client
     client_id = f'anpr_server_{os.getpid()}'
-    mqtt_client = mqtt.Client(client_id=client_id)
+    protocol = mqtt.MQTTv5 if MQTT_PROTOCOL_VERSION == 5 else mqtt.MQTTv311
+    mqtt_client = mqtt.Client(client_id=client_id, protocol=protocol)
     
     # Set auth if provided
     if username and password:
@@ -113,6 +213,7 @@ def on_connect(client, userdata, flags, rc, properties=None):
         topics = [
             TOPIC_GATE_STATUS,
             TOPIC_GATE_ACCESS,
+            TOPIC_GATE_ACCESS_RAW,
             TOPIC_GATE_SYNC,
             TOPIC_GATE_SYNC_REQUEST,
             TOPIC_GATE_SYNC_LOGS
@@ -128,7 +229,10 @@ def on_message(client, userdata, message):
     """Callback for when a message is received"""
     try:
         topic = message.topic
-        payload = json.loads(message.payload.decode("utf-8"))
+        if topic.endswith('/access/raw'):
+            payload = raw_access_payload(message)
+        else:
+            payload = json.loads(message.payload.decode("utf-8"))
 
         print(f"Received message on {topic}")
         
@@ -143,44 +247,70 @@ def on_message(client, userdata, message):
         # Add topic to payload for sync handling
         payload['topic'] = topic
 
-        # Create app context for database operations
-        with client.app.app_context():
-            if action == 'status':
-                print(f"Handling gate status for gate {gate_id}")
-                handle_gate_status(gate_id, payload)
-            elif action == 'access':
-                print(f"Handling gate access for gate {gate_id}")
-                handle_gate_access(gate_id, payload)
-            elif action == 'sync':
-                print(f"Handling gate sync for gate {gate_id}")
-                handle_gate_sync(gate_id, payload)
+        # Hand the message over to the worker pool so a slow handler never
+        # blocks the network loop. Sync traffic gets its own ordering key so
+        # BigQuery round-trips don't delay the barrier of the same gate.
+        key = f"{gate_id}/sync" if action == 'sync' else gate_id
+        dispatcher.submit(key, route_message, client, gate_id, action, payload)
             
     except json.JSONDecodeError as e:
         print(f"Error decoding message payload: {e}")
     except Exception as e:
         print(f"Error processing message: {e}")
 
+def raw_access_payload(message):
+    """
+    Build the access payload of a frame published on gate/<id>/access/raw.
+
+    The message payload is the image itself and is passed on as a memoryview,
+    so it is never copied or re-encoded. Metadata, if any, comes in MQTT v5
+    user properties.
+    """
+    payload = {'image': memoryview(message.payload)}
+    properties = getattr(message, 'properties', None)
+    for name, value in getattr(properties, 'UserProperty', None) or []:
+        payload.setdefault(name, value)
+    return payload
+
+def route_message(client, gate_id, action, payload):
+    """Run the handler for a gate message (called from a dispatcher worker)"""
+    # Create app context for database operations
+    with client.app.app_context():
+        if action == 'status':
+            print(f"Handling gate status for gate {gate_id}")
+            handle_gate_status(gate_id, payload)
+        elif action == 'access':
+            print(f"Handling gate access for gate {gate_id}")
+            handle_gate_access(gate_id, payload)
+        elif action == 'sync':
+            print(f"Handling gate sync for gate {gate_id}")
+            handle_gate_sync(gate_id, payload)
+
 def handle_gate_status(gate_id, payload):
     """Handle gate status updates"""
+    status = payload.get('status', 'offline')
+    if gate_registry.update(gate_id, status):
+        print(f"Gate {gate_id} status updated successfully. Status: {status}")
+        return
+
     with mqtt_client.app.app_context():
-        gate = db.get_gate(gate_id)
-        if gate:
-            success = db.update_gate_status(
-                gate_id=gate_id,
-                status=payload.get('status', 'offline'),
-                last_online=datetime.now() if payload.get('status') == 'online' else gate.last_online,
-            )
-            if success:
-                print(f"Gate {gate_id} status updated successfully. Status: {payload.get('status', 'offline')}")
-            else:
-                print(f"Failed to update gate {gate_id} status")
-        else: 
-            print(f"Gate {gate_id} not found, creating new gate")
-            success, errors = db.add_gate(gate_id, payload.get('location', 'Unknown'))
-            if success:
-                print(f"Gate {gate_id} created successfully")
-            else:
-                print(f"Error creating gate {gate_id}: {errors}")
+        # The gate may have been created elsewhere since the registry was loaded
+        if replica.get_gate(gate_id) or db.get_gate(gate_id):
+            print(f"Gate {gate_id} not in the status registry, reloading it")
+            gate_registry.load()
+            if gate_registry.update(gate_id, status):
+                print(f"Gate {gate_id} status updated successfully. Status: {status}")
+                return
+
+        print(f"Gate {gate_id} not found, creating new gate")
+        location = payload.get('location', 'Unknown')
+        last_online = datetime.now() if status == 'online' else None
+        success, errors = replica.add_gate(gate_id, location, status=status, last_online=last_online)
+        if success:
+            gate_registry.add(gate_id, location, status=status, last_online=last_online)
+            print(f"Gate {gate_id} created successfully")
+        else:
+            print(f"Error creating gate {gate_id}: {errors}")
 
 def handle_gate_access(gate_id, payload, url=None):
     """Handle access requests from gates"""
@@ -188,23 +318,32 @@ def handle_gate_access(gate_id, payload, url=None):
         # Process image with YOLO API
         image_data = None
         if url is None:
-            # Decode base64 image data
-            image_data = base64.b64decode(payload['image'])
+            image_data = payload['image']
+            if isinstance(image_data, str):
+                # JSON frames from older firmware carry the image in base64
+                image_data = base64.b64decode(image_data)
         
-        plate_text, confidence = process_image_with_yolo(image_data, url=url)
+        plate_text, confidence = process_image_with_yolo(image_data, url=url, gate_id=gate_id)
         print(f"Detected plate: {plate_text} with confidence: {confidence}")        
+        response_topic = TOPIC_SERVER_RESPONSE.format(gate_id=gate_id)
+
+        # Same car still in front of the gate: repeat the decision without a
+        # new log or toggling it between entering and leaving
+        previous = access_dedup.get(gate_id, plate_text)
+        if previous is not None:
+            print(f"Repeated detection of {plate_text} at gate {gate_id}, resending last decision")
+            mqtt_client.publish(response_topic, json.dumps(previous))
+            return
+
         # Check authorization
         is_authorized = False
         accessing = False
-        vehicle_row = sqlite.get_vehicle_by_plate_number(plate_text)
-        vehicle_data = dict(vehicle_row) if vehicle_row else None
-        print(f"Vehicle data for plate {plate_text}: {vehicle_data}")
-        if vehicle_data:
-            vehicle = Vehicle(vehicle_data)
-            if vehicle.is_authorized and vehicle.is_currently_valid():
-                is_authorized = True
-                accessing = sqlite.is_vehicle_in_parking(vehicle.plate_number) 
-                accessing = not accessing
+        vehicle = sqlite.get_authorized_vehicle(plate_text)
+        print(f"Vehicle data for plate {plate_text}: {vehicle}")
+        if vehicle and vehicle.is_currently_valid():
+            is_authorized = True
+            accessing = sqlite.is_vehicle_in_parking(vehicle.plate_number) 
+            accessing = not accessing
 
         # Log access attempt    
         success = sqlite.create_access_log(
@@ -217,7 +356,6 @@ def handle_gate_access(gate_id, payload, url=None):
 
         # Send response back to gate
         print(f"Sending response to gate {gate_id}: {is_authorized}")
-        response_topic = TOPIC_SERVER_RESPONSE.format(gate_id=gate_id)
         response = {
             'plate_number': plate_text,
             'access_granted': is_authorized,
@@ -226,8 +364,189 @@ def handle_gate_access(gate_id, payload, url=None):
             'accessing': accessing
 
         }
+        if is_recognized(plate_text, confidence):
+            access_dedup.record(gate_id, plate_text, response)
         mqtt_client.publish(response_topic, json.dumps(response))
 
+def vehicle_to_sync_dict(row):
+    """Convert a BigQuery vehicle row to the dict sent to gates"""
+    vehicle = Vehicle(row)
+    return {
+        'plate_number': vehicle.plate_number,
+        'owner_name': vehicle.owner_name,
+        'valid_from': vehicle.valid_from.isoformat() if vehicle.valid_from else None,
+        'valid_until': vehicle.valid_until.isoformat() if vehicle.valid_until else None,
+        'is_authorized': vehicle.is_authorized
+    }
+
+def build_vehicle_sync(since_version, sync_version=None):
+    """
+    Build the vehicle sync response for a gate
+    
+    Args:
+        since_version (int): Sync version the gate currently has, 0 if none
+        sync_version (int): Current server sync version, read from BigQuery if None
+        
+    Returns:
+        dict: mode ('snapshot' or 'delta'), vehicles to upsert, plates
+        deleted since since_version and the new sync_version
+    """
+    if sync_version is None:
+        sync_version = db.get_sync_info()['sync_version']
+
+    if since_version <= 0 or sync_version <= 0:
+        # Gate without data (or unknown server version): send everything
+        mode = 'snapshot'
+        vehicles = db.get_vehicles()
+        deleted = []
+    elif since_version == sync_version:
+        # Gate already up to date: nothing to query
+        mode = 'delta'
+        vehicles = []
+        deleted = []
+    else:
+        # Rows streamed with a timestamp slightly older than the version the
+        # gate already has would be missed, so re-send an overlap window
+        mode = 'delta'
+        overlap = SYNC_OVERLAP_SECONDS * 1_000_000
+        vehicles, deleted = db.get_vehicle_changes(max(since_version - overlap, 0))
+
+    return {
+        'mode': mode,
+        'vehicles': [vehicle_to_sync_dict(v) for v in vehicles],
+        'deleted': deleted,
+        'sync_version': sync_version
+    }
+
+def _sync_key(since_version, sync_version):
+    if since_version <= 0 or sync_version <= 0:
+        return ('snapshot', 0, sync_version)
+    return ('delta', since_version, sync_version)
+
+def _get_sync_response(key):
+    mode, since_version, sync_version = key
+
+    def build_response():
+        response = build_vehicle_sync(since_version, sync_version)
+        response['timestamp'] = datetime.now().isoformat()
+        return response
+
+    return sync_payload_cache.get_or_load(('response',) + key, build_response)
+
+def get_sync_payload(since_version, fmt='json'):
+    """
+    Get the serialized sync response for a gate at since_version.
+
+    Gates asking for the same versions share one BigQuery read and one
+    serialized payload per format; concurrent requests wait for the one
+    being built.
+
+    Returns:
+        tuple: (payload bytes, response dict)
+    """
+    key = _sync_key(since_version, db.get_sync_info()['sync_version'])
+    response = _get_sync_response(key)
+    payload = sync_payload_cache.get_or_load(('payload', fmt) + key,
+                                             lambda: encode_sync_response(response, fmt))
+    return payload, response
+
+def get_sync_transfer(since_version, fmt='json', sync_version=None):
+    """
+    Get a sync response split into chunks of SYNC_CHUNK_SIZE vehicles.
+
+    Every chunk is a self-contained payload in the given format. The manifest
+    carries the mode, the deletions, the number of chunks and the CRC32 of
+    each one, so the gate can check chunks and ask again for missing ones.
+
+    Args:
+        since_version (int): Sync version the gate currently has, 0 if none
+        fmt (str): Payload format of the chunks
+        sync_version (int): Server version to send, the current one if None
+
+    Returns:
+        tuple: (manifest dict, list of chunk payloads)
+    """
+    if sync_version is None:
+        sync_version = db.get_sync_info()['sync_version']
+    key = _sync_key(since_version, sync_version)
+
+    def build_transfer():
+        response = _get_sync_response(key)
+        # Unique per versions and format; resumes look the transfer up by it
+        transfer_id = '.'.join(str(part) for part in key + (fmt,))
+        vehicles = response['vehicles']
+        chunks = [
+            encode_sync_response({
+                'transfer_id': transfer_id,
+                'index': index,
+                'vehicles': vehicles[start:start + SYNC_CHUNK_SIZE]
+            }, fmt)
+            for index, start in enumerate(range(0, len(vehicles), SYNC_CHUNK_SIZE))
+        ]
+        manifest = {
+            'transfer_id': transfer_id,
+            'mode': response['mode'],
+            'sync_version': response['sync_version'],
+            'deleted': response['deleted'],
+            'timestamp': response['timestamp'],
+            'vehicle_count': len(vehicles),
+            'chunk_count': len(chunks),
+            'checksums': [zlib.crc32(chunk) for chunk in chunks]
+        }
+        return manifest, chunks
+
+    transfer = sync_payload_cache.get_or_load(('transfer', fmt) + key, build_transfer)
+    sync_transfer_cache.set(transfer[0]['transfer_id'], transfer)
+    return transfer
+
+def get_resumed_transfer(transfer_id):
+    """
+    Get the transfer a gate is resuming, exactly as described by its manifest.
+
+    Returns:
+        tuple: (manifest, chunks), pinned for another SYNC_TRANSFER_TTL, or
+        None if the transfer expired and the gate has to start over
+    """
+    transfer = sync_transfer_cache.get(transfer_id)
+    if transfer is not None:
+        sync_transfer_cache.set(transfer_id, transfer)
+    return transfer
+
+def publish_sync_transfer(gate_id, payload, since_version, fmt):
+    """Send a chunked sync response, or only the chunks a resuming gate is missing"""
+    chunk_topic = TOPIC_GATE_SYNC_CHUNK.format(gate_id=gate_id)
+    transfer_id = payload.get('transfer_id')
+    missing = payload.get('chunks')
+
+    if transfer_id and missing is not None:
+        transfer = get_resumed_transfer(transfer_id)
+        if transfer is None:
+            # Chunks rebuilt from current data would not match the gate's manifest
+            print(f"Transfer {transfer_id} of gate {gate_id} expired, asking the gate to restart")
+            mqtt_client.publish(TOPIC_GATE_SYNC_RESPONSE.format(gate_id=gate_id), json.dumps({
+                'transfer_id': transfer_id,
+                'error': 'transfer_expired',
+                'restart': True
+            }))
+            return
+        try:
+            manifest, chunks = transfer
+            indices = sorted({int(index) for index in missing if 0 <= int(index) < len(chunks)})
+        except (ValueError, TypeError) as e:
+            print(f"Invalid resume request from gate {gate_id}: {e}")
+        else:
+            for index in indices:
+                mqtt_client.publish(chunk_topic, chunks[index])
+            print(f"Re-sent {len(indices)} of {len(chunks)} chunks of {transfer_id} to gate {gate_id}")
+            return
+
+    manifest, chunks = get_sync_transfer(since_version, fmt)
+    mqtt_client.publish(TOPIC_GATE_SYNC_RESPONSE.format(gate_id=gate_id), json.dumps(manifest))
+    for chunk in chunks:
+        mqtt_client.publish(chunk_topic, chunk)
+    print(f"Sent {manifest['mode']} version {manifest['sync_version']} to gate {gate_id} in "
+          f"{len(chunks)} chunks ({sum(len(chunk) for chunk in chunks)} bytes)")
+
 def handle_gate_sync(gate_id, payload):
     """Handle gate synchronization requests"""
     try:
@@ -240,49 +559,24 @@ def handle_gate_sync(gate_id, payload):
 
             if sync_type == 'request':
                 # Handle vehicle list sync request
-                print(f"Processing sync request with version {payload.get('sync_version', 0)}")
-                
-                # Get all authorized vehicles from BigQuery
-                vehicles_data = db.get_vehicles()
-
-                print(f"Found {len(vehicles_data)} authorized vehicles for sync")
-
-                sync_info = db.get_sync_info()
-                last_sync = sqlite.get_vehicle_last_sync_time()
-
-                if last_sync is not None:
-                    dt = datetime.fromisoformat(last_sync)
-                    last_sync = dt.replace(tzinfo=None)
-
-                sync_version = sync_info['sync_version']
+                since_version = int(payload.get('sync_version') or 0)
+                # Gates that list no formats only understand plain JSON
+                fmt = choose_format(payload.get('formats'))
+                print(f"Processing sync request with version {since_version} ({fmt})")
 
-                print(f"Last sync: {last_sync}")
+                if payload.get('chunked'):
+                    publish_sync_transfer(gate_id, payload, since_version, fmt)
+                else:
+                    sync_payload, response = get_sync_payload(since_version, fmt)
 
-                vehicle_list = []
-                for v in vehicles_data:
-                    # Si el vehículo nunca fue sincronizado o fue sincronizado antes del último sync global
-                    if last_sync is None or (last_sync and last_sync < v.last_sync):
-                        vehicle_list.append({
-                            'plate_number': Vehicle(v).plate_number,
-                            'owner_name': Vehicle(v).owner_name,
-                            'valid_from': Vehicle(v).valid_from.isoformat() if Vehicle(v).valid_from else None,
-                            'valid_until': Vehicle(v).valid_until.isoformat() if Vehicle(v).valid_until else None,
-                            'is_authorized': Vehicle(v).is_authorized
-                        })
+                    print(f"Prepared {response['mode']} with {len(response['vehicles'])} vehicles "
+                          f"and {len(response['deleted'])} deletions for gate {gate_id}")
 
-                print(f"Prepared vehicle list with {len(vehicle_list)} vehicles for gate {gate_id}")
-
-                # Send response with vehicle list
-                response_topic = TOPIC_GATE_SYNC_RESPONSE.format(gate_id=gate_id)             
-                
-                response = {
-                    'vehicles': vehicle_list,
-                    'sync_version': db.get_sync_info()['sync_version'],
-                    'timestamp': datetime.now().isoformat()
-                }
-
-                mqtt_client.publish(response_topic, json.dumps(response))
-                print(f"Sent sync response with {len(vehicle_list)} vehicles")
+                    # Send response with vehicle list
+                    response_topic = TOPIC_GATE_SYNC_RESPONSE.format(gate_id=gate_id)
+                    mqtt_client.publish(response_topic, sync_payload)
+                    print(f"Sent sync response version {response['sync_version']} to gate {gate_id} "
+                          f"({len(sync_payload)} bytes)")
 
             elif sync_type == 'logs':
                 # Handle access logs sync
@@ -302,18 +596,19 @@ def handle_gate_sync(gate_id, payload):
 
                     return log_obj
 
+                rows = []
                 for log in logs:
                     try:
                         log['gate_id'] = gate_id
-                        log = normalize_log_for_bigquery(log)
-                        print(log)
-                        if db.create_access_log(**log):
-                            success_logs.append(log['id'])
-                        else:
-                            failed_logs.append(log['id'])
+                        rows.append(normalize_log_for_bigquery(log))
                     except Exception as e:
-                        print(f"Error processing log {log['id']}: {e}")
-                        failed_logs.append(log['id'])
+                        print(f"Error processing log {log.get('id')}: {e}")
+                        failed_logs.append(log.get('id'))
+
+                # One streaming insert for the whole batch
+                inserted, failed = db.create_access_logs_bulk(rows)
+                success_logs.extend(inserted)
+                failed_logs.extend(failed)
 
                 # Send acknowledgment
                 response_topic = TOPIC_GATE_SYNC_LOGS_ACK.format(gate_id=gate_id)
@@ -0,0 +1,57 @@
+import hashlib
+import threading
+import time
+
+from .database.cache import TTLCache
+
+
+class RecognitionCache:
+    """
+    Short-lived cache of ANPR results per gate.
+
+    A frame is looked up by the hash of its bytes, so only a frame the gate
+    sends again byte for byte reuses the first result. Near-identical frames
+    are not matched: a different car in the same spot would get the previous
+    car's plate, and with it the previous access decision.
+    """
+
+    def __init__(self, ttl=10, maxsize=256):
+        self.ttl = ttl
+        self._results = TTLCache(ttl, maxsize=maxsize)
+
+    def get(self, gate_id, image_data):
+        """
+        Returns:
+            tuple: (cached result or None, lookup key to pass to put())
+        """
+        digest = hashlib.blake2b(image_data, digest_size=16).digest()
+        return self._results.get((gate_id, digest)), digest
+
+    def put(self, gate_id, digest, result):
+        self._results.set((gate_id, digest), result)
+
+
+class AccessDedupWindow:
+    """
+    Remembers the last access decision of every gate for a few seconds.
+
+    Repeat detections of the same plate at the same gate inside the window
+    get the first decision again, without a new access log or flipping the
+    vehicle between entering and leaving.
+    """
+
+    def __init__(self, window=15):
+        self.window = window
+        self._last = {}  # gate_id -> (expires_at, plate_number, response)
+        self._lock = threading.Lock()
+
+    def get(self, gate_id, plate_number):
+        with self._lock:
+            entry = self._last.get(gate_id)
+        if entry and entry[0] > time.monotonic() and entry[1] == plate_number:
+            return entry[2]
+        return None
+
+    def record(self, gate_id, plate_number, response):
+        with self._lock:
+            self._last[gate_id] = (time.monotonic() + self.window, plate_number, response)
@@ -0,0 +1,57 @@
+import json
+import zlib
+
+# Wire formats of the vehicle sync response. Gates list the ones they
+# understand in the 'formats' field of their sync request; gates that send
+# no list get plain JSON.
+FORMAT_JSON = 'json'
+FORMAT_COLUMNAR_ZLIB = 'columnar+zlib'
+SUPPORTED_FORMATS = (FORMAT_COLUMNAR_ZLIB, FORMAT_JSON)
+
+VEHICLE_FIELDS = ('plate_number', 'owner_name', 'valid_from', 'valid_until', 'is_authorized')
+
+# First byte of a zlib stream with the default window size; a JSON object starts with '{'
+ZLIB_HEADER = 0x78
+
+
+def choose_format(accepted):
+    """Pick the most compact format both sides understand"""
+    for fmt in SUPPORTED_FORMATS:
+        if fmt in (accepted or []):
+            return fmt
+    return FORMAT_JSON
+
+
+def encode_sync_response(response, fmt=FORMAT_JSON):
+    """
+    Serialize a sync response dict
+
+    Returns:
+        bytes: Payload ready to publish
+    """
+    if fmt != FORMAT_COLUMNAR_ZLIB:
+        return json.dumps(response).encode()
+
+    vehicles = response.get('vehicles', [])
+    columnar = dict(response)
+    columnar['format'] = FORMAT_COLUMNAR_ZLIB
+    columnar['vehicles'] = {field: [vehicle.get(field) for vehicle in vehicles] for field in VEHICLE_FIELDS}
+    return zlib.compress(json.dumps(columnar, separators=(',', ':')).encode())
+
+
+def decode_sync_response(raw):
+    """
+    Parse a sync response in any supported format
+
+    Returns:
+        dict: Response with 'vehicles' as a list of vehicle dicts
+    """
+    if raw[:1] == bytes([ZLIB_HEADER]):
+        raw = zlib.decompress(raw)
+    response = json.loads(raw)
+
+    vehicles = response.get('vehicles')
+    if isinstance(vehicles, dict):
+        columns = [vehicles.get(field, []) for field in VEHICLE_FIELDS]
+        response['vehicles'] = [dict(zip(VEHICLE_FIELDS, values)) for values in zip(*columns)]
+    return response
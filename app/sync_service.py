@@ -1,9 +1,12 @@
 import os
 import time
 import json
+import threading
+import zlib
 from datetime import datetime
 import paho.mqtt.client as mqtt
 from app.database.sqlite_db import SQLiteDB
+from app.sync_format import SUPPORTED_FORMATS, decode_sync_response
 import logging
 from dotenv import load_dotenv
 
@@ -26,6 +29,9 @@ MQTT_USERNAME = os.getenv('MQTT_USERNAME')
 MQTT_PASSWORD = os.getenv('MQTT_PASSWORD')
 GATE_ID = os.getenv('GATE_ID', 'EC:64:C9:AC:C9:A4')
 SYNC_INTERVAL = int(os.getenv('SYNC_INTERVAL', 300)) 
+FULL_SYNC_INTERVAL = int(os.getenv('FULL_SYNC_INTERVAL', 86400))  # Force a full snapshot this often
+SYNC_CHUNK_TIMEOUT = int(os.getenv('SYNC_CHUNK_TIMEOUT', 30))  # Ask for missing chunks after this long without one
+SYNC_CHUNK_MAX_RETRIES = int(os.getenv('SYNC_CHUNK_MAX_RETRIES', 5))  # Then start the transfer over
 DB_PATH = os.getenv('LOCAL_DATABASE_URL')
 
 class SyncService:
@@ -33,6 +39,11 @@ class SyncService:
         """Initialize sync service"""
         self.db = SQLiteDB(DB_PATH)
         self.mqtt_client = None
+        self.last_full_sync = time.monotonic()
+        # Chunked sync in progress: manifest, received chunk indices, resume attempts
+        self.transfer = None
+        self.transfer_lock = threading.RLock()
+        self.transfer_timer = None
         self.setup_mqtt()
 
     def setup_mqtt(self):
@@ -66,6 +77,7 @@ class SyncService:
             # Subscribe to sync response topics
             topics = [
                 f"gate/{GATE_ID}/sync/response",
+                f"gate/{GATE_ID}/sync/chunk",
                 f"gate/{GATE_ID}/sync/logs/ack"
             ]
             for topic in topics:
@@ -88,15 +100,24 @@ class SyncService:
     def on_message(self, client, userdata, msg):
         """Handle incoming MQTT messages"""
         try:
-            payload = json.loads(msg.payload.decode())
-            logger.debug(f"Received message on {msg.topic}: {payload}")
-
             if msg.topic.endswith('/sync/response'):
-                self.handle_sync_response(payload)
+                # Sync responses may come compressed
+                payload = decode_sync_response(msg.payload)
+                logger.debug(f"Received sync response on {msg.topic}: {len(msg.payload)} bytes")
+                if 'chunk_count' in payload:
+                    self.handle_sync_manifest(payload)
+                elif payload.get('restart'):
+                    self.handle_transfer_restart(payload)
+                else:
+                    self.handle_sync_response(payload)
+            elif msg.topic.endswith('/sync/chunk'):
+                self.handle_sync_chunk(msg.payload)
             elif msg.topic.endswith('/sync/logs/ack'):
+                payload = json.loads(msg.payload.decode())
+                logger.debug(f"Received message on {msg.topic}: {payload}")
                 self.handle_logs_ack(payload)
 
-        except json.JSONDecodeError:
+        except (json.JSONDecodeError, zlib.error):
             logger.error(f"Failed to decode message: {msg.payload}")
         except Exception as e:
             logger.error(f"Error handling message: {e}")
@@ -104,30 +125,154 @@ class SyncService:
     def handle_sync_response(self, payload):
         """Handle vehicle list sync response"""
         try:
+            if 'error' in payload:
+                logger.error(f"Server failed to build sync response: {payload['error']}")
+                return
+
             vehicles = payload.get('vehicles', [])
+            deleted = payload.get('deleted', [])
             sync_version = payload.get('sync_version')
-            
-            if vehicles and sync_version:
-                self.db.update_vehicles(vehicles)
-                self.db.update_sync_version(sync_version)
-                logger.info(f"Synchronized {len(vehicles)} vehicles to version {sync_version}")
+            # Servers without delta support only send upserts
+            mode = payload.get('mode', 'delta')
+
+            if not sync_version:
+                return
+
+            if mode == 'snapshot':
+                self.db.update_vehicles(vehicles, replace=True)
+                self.last_full_sync = time.monotonic()
+            elif vehicles or deleted:
+                self.db.update_vehicles(vehicles, deleted=deleted)
+            self.db.update_sync_version(sync_version)
+            logger.info(f"Applied {mode} sync: {len(vehicles)} vehicles, {len(deleted)} deletions, "
+                        f"version {sync_version}")
             
         except Exception as e:
             logger.error(f"Error handling sync response: {e}")
 
+    def handle_sync_manifest(self, manifest):
+        """Start a chunked sync transfer"""
+        with self.transfer_lock:
+            if self.transfer and self.transfer['manifest']['transfer_id'] == manifest['transfer_id']:
+                # Same transfer announced again, keep the chunks already applied
+                return
+
+            self.transfer = {'manifest': manifest, 'received': set(), 'retries': 0}
+            if manifest['mode'] == 'snapshot':
+                self.db.begin_vehicle_snapshot()
+            logger.info(f"Receiving {manifest['mode']} sync version {manifest['sync_version']}: "
+                        f"{manifest['vehicle_count']} vehicles in {manifest['chunk_count']} chunks")
+            self._finish_transfer_if_complete()
+
+    def handle_transfer_restart(self, payload):
+        """The server no longer has the transfer in progress: start a new one"""
+        with self.transfer_lock:
+            if self.transfer is None or self.transfer['manifest']['transfer_id'] != payload.get('transfer_id'):
+                return
+            logger.warning(f"Sync transfer {payload['transfer_id']} expired on the server, starting over")
+            self.transfer = None
+            self._cancel_transfer_timer()
+        self.request_sync()
+
+    def handle_sync_chunk(self, raw):
+        """Apply one chunk of the transfer in progress"""
+        try:
+            with self.transfer_lock:
+                if self.transfer is None:
+                    return
+                manifest = self.transfer['manifest']
+                chunk = decode_sync_response(raw)
+                index = chunk.get('index')
+                if chunk.get('transfer_id') != manifest['transfer_id'] or index in self.transfer['received']:
+                    return
+                if not 0 <= index < manifest['chunk_count'] or zlib.crc32(raw) != manifest['checksums'][index]:
+                    logger.warning(f"Discarding corrupt sync chunk {index}")
+                    return
+
+                if manifest['mode'] == 'snapshot':
+                    self.db.add_snapshot_vehicles(chunk['vehicles'])
+                else:
+                    self.db.update_vehicles(chunk['vehicles'])
+                self.transfer['received'].add(index)
+                self._finish_transfer_if_complete()
+
+        except Exception as e:
+            logger.error(f"Error handling sync chunk: {e}")
+
+    def _finish_transfer_if_complete(self):
+        # Called with transfer_lock held
+        manifest = self.transfer['manifest']
+        if len(self.transfer['received']) < manifest['chunk_count']:
+            self._arm_transfer_timer()
+            return
+
+        if manifest['mode'] == 'snapshot':
+            self.db.finish_vehicle_snapshot()
+            self.last_full_sync = time.monotonic()
+        elif manifest['deleted']:
+            self.db.update_vehicles([], deleted=manifest['deleted'])
+        self.db.update_sync_version(manifest['sync_version'])
+        self.transfer = None
+        self._cancel_transfer_timer()
+        logger.info(f"Applied chunked {manifest['mode']} sync: {manifest['vehicle_count']} vehicles, "
+                    f"{len(manifest['deleted'])} deletions, version {manifest['sync_version']}")
+
+    def _arm_transfer_timer(self):
+        self._cancel_transfer_timer()
+        self.transfer_timer = threading.Timer(SYNC_CHUNK_TIMEOUT, self.request_missing_chunks)
+        self.transfer_timer.daemon = True
+        self.transfer_timer.start()
+
+    def _cancel_transfer_timer(self):
+        if self.transfer_timer is not None:
+            self.transfer_timer.cancel()
+            self.transfer_timer = None
+
+    def request_missing_chunks(self):
+        """Ask the server again for the chunks that have not arrived"""
+        try:
+            with self.transfer_lock:
+                if self.transfer is None:
+                    return
+                manifest = self.transfer['manifest']
+                if self.transfer['retries'] >= SYNC_CHUNK_MAX_RETRIES:
+                    logger.warning(f"Giving up on sync transfer {manifest['transfer_id']}, starting over")
+                    self.transfer = None
+                    self._cancel_transfer_timer()
+                    self.request_sync()
+                    return
+
+                self.transfer['retries'] += 1
+                missing = [index for index in range(manifest['chunk_count'])
+                           if index not in self.transfer['received']]
+                request = {
+                    'gate_id': GATE_ID,
+                    'sync_version': self.db.get_sync_info()['sync_version'],
+                    'formats': list(SUPPORTED_FORMATS),
+                    'chunked': True,
+                    'transfer_id': manifest['transfer_id'],
+                    'chunks': missing
+                }
+                self.mqtt_client.publish(f"gate/{GATE_ID}/sync/request", json.dumps(request))
+                self._arm_transfer_timer()
+                logger.info(f"Requested {len(missing)} missing chunks of {manifest['transfer_id']}")
+
+        except Exception as e:
+            logger.error(f"Error requesting missing chunks: {e}")
+
     def handle_logs_ack(self, payload):
         """Handle acknowledgment of synced logs"""
         try:
-            if payload.get('status') == 'success':
-                log_ids = payload.get('log_ids', [])
-                if log_ids:
-                    self.db.mark_logs_synced(log_ids)
-                    logger.info(f"Marked {len(log_ids)} logs as synced")
-            else:
-                log_ids = payload.get('log_ids', [])
-                if log_ids:
-                    self.db.increment_retry_count(log_ids)
-                    logger.warning(f"Sync failed for {len(log_ids)} logs")
+            # A partial ack lists both the stored and the failed logs
+            log_ids = payload.get('log_ids', [])
+            if log_ids:
+                self.db.mark_logs_synced(log_ids)
+                logger.info(f"Marked {len(log_ids)} logs as synced")
+
+            failed_log_ids = [log_id for log_id in payload.get('failed_log_ids', []) if log_id]
+            if failed_log_ids:
+                self.db.increment_retry_count(failed_log_ids)
+                logger.warning(f"Sync failed for {len(failed_log_ids)} logs")
                 
         except Exception as e:
             logger.error(f"Error handling logs acknowledgment: {e}")
@@ -135,14 +280,26 @@ class SyncService:
     def request_sync(self):
         """Request vehicle list synchronization"""
         try:
+            with self.transfer_lock:
+                if self.transfer is not None:
+                    # The transfer timer asks for whatever is still missing
+                    return
+
             sync_info = self.db.get_sync_info()
+            sync_version = sync_info['sync_version']
+            # Version 0 asks for a full snapshot, which also clears vehicles
+            # deleted on the server without leaving a tombstone
+            if time.monotonic() - self.last_full_sync >= FULL_SYNC_INTERVAL:
+                sync_version = 0
             request = {
                 'gate_id': GATE_ID,
-                'sync_version': sync_info['sync_version']
+                'sync_version': sync_version,
+                'formats': list(SUPPORTED_FORMATS),
+                'chunked': True
             }
             topic = f"gate/{GATE_ID}/sync/request"
             self.mqtt_client.publish(topic, json.dumps(request))
-            logger.info(f"Requested sync with version {sync_info['sync_version']}")
+            logger.info(f"Requested sync with version {sync_version}")
             
         except Exception as e:
             logger.error(f"Error requesting sync: {e}")
@@ -0,0 +1,340 @@
+"""
+YOLO + PaddleOCR licence plate pipeline.
+
+Imported by the Flask service in app.py, and loaded directly by the main
+server when it runs with ANPR_BACKEND=inprocess.
+"""
+import io
+from PIL import Image
+import urllib.request
+import cv2
+import numpy as np
+from paddleocr import PaddleOCR
+import json
+import re
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from batching import MicroBatcher
+from detector import create_detector
+
+# Number of PaddleOCR engines kept in memory (one per concurrent OCR call)
+OCR_POOL_SIZE = int(os.getenv('OCR_POOL_SIZE', 2))
+
+# Micro-batching: a batch is closed after BATCH_MAX_SIZE images or BATCH_MAX_WAIT_MS
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', 8))
+BATCH_MAX_WAIT_MS = int(os.getenv('BATCH_MAX_WAIT_MS', 10))
+
+# Plate detector: pytorch, onnx or openvino; threads 0 keeps the library default
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'pytorch')
+INFERENCE_THREADS = int(os.getenv('INFERENCE_THREADS', 0))
+INFERENCE_INT8 = os.getenv('INFERENCE_INT8', 'false').lower() in ('1', 'true', 'yes')
+
+# Pre-processing: JPEG decode at 1/DECODE_REDUCTION size (1, 2, 4 or 8), frames
+# resized to MODEL_INPUT_SIZE before detection, optional per-gate region of interest
+DECODE_REDUCTION = int(os.getenv('DECODE_REDUCTION', 1))
+MODEL_INPUT_SIZE = int(os.getenv('MODEL_INPUT_SIZE', 640))
+GATE_ROI_FILE = os.getenv('GATE_ROI_FILE')
+
+# Return annotated copies of the frames (slower, for debugging only)
+ANPR_DEBUG = os.getenv('ANPR_DEBUG', 'false').lower() in ('1', 'true', 'yes')
+
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+
+def load_gate_rois(path):
+    """
+    Load the region of interest of every gate camera.
+
+    The file maps gate ids to [x1, y1, x2, y2] as fractions of the frame
+    size, so the same ROI holds at any decode reduction.
+    """
+    if not path:
+        return {}
+    with open(path) as f:
+        rois = json.load(f)
+    for gate_id, roi in rois.items():
+        x1, y1, x2, y2 = roi
+        if not (0 <= x1 < x2 <= 1 and 0 <= y1 < y2 <= 1):
+            raise ValueError(f"Invalid ROI for gate {gate_id}: {roi}")
+    return rois
+
+
+class OCRPool:
+    """
+    Fixed-size pool of PaddleOCR engines.
+    A PaddleOCR instance is not safe to share between threads, so each OCR
+    call checks an engine out of the pool and returns it when done.
+    """
+    def __init__(self, size):
+        self.size = size
+        self._engines = queue.Queue()
+        for _ in range(size):
+            self._engines.put(PaddleOCR(use_angle_cls=True, lang="en"))
+
+    @contextmanager
+    def engine(self):
+        ocr = self._engines.get()
+        try:
+            yield ocr
+        finally:
+            self._engines.put(ocr)
+
+    def warm_up(self, image):
+        """Run one OCR pass through every engine in the pool"""
+        engines = [self._engines.get() for _ in range(self.size)]
+        try:
+            for ocr in engines:
+                ocr.ocr(image, cls=True)
+        finally:
+            for ocr in engines:
+                self._engines.put(ocr)
+
+
+# Path of the YOLO weights; relative paths are resolved against this directory
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.getenv('YOLO_MODEL_PATH', 'models/best.pt'))
+
+# Initialize models
+detector = create_detector(INFERENCE_BACKEND, MODEL_PATH, threads=INFERENCE_THREADS or None, int8=INFERENCE_INT8)
+ocr_pool = OCRPool(OCR_POOL_SIZE)
+
+gate_rois = load_gate_rois(GATE_ROI_FILE)
+
+# Set once the models have run a first inference
+ready = threading.Event()
+
+
+def encode_image_pil(image):
+    """Converts a NumPy array to JPEG bytes using PIL."""
+    if image.shape[2] == 3:  # If image has 3 channels (RGB/BGR)
+        image = image[..., ::-1]  # Invert channels to convert BGR to RGB
+    
+    pil_img = Image.fromarray(image)
+    img_byte_arr = io.BytesIO()  # Create a bytes buffer in memory
+    pil_img.save(img_byte_arr, format="JPEG")  # Save as JPEG
+    return img_byte_arr.getvalue()
+
+def extract_license_plate(ocr_result, confidence_threshold=0.7):
+    """
+    Extracts and cleans the text OCR with highest confidence.
+    """
+    if not ocr_result or not ocr_result[0]:
+        return "No plate detected", 0.0
+
+    best_text = ""
+    max_confidence = 0
+
+    for detection in ocr_result[0]:
+        text = detection[1][0]
+        confidence = detection[1][1]
+
+        if confidence > confidence_threshold and confidence > max_confidence:
+            best_text = text
+            max_confidence = confidence
+
+    cleaned_text = re.sub(r'[^A-Za-z0-9]', '', best_text).upper()
+    return cleaned_text if cleaned_text else "No plate detected", max_confidence
+
+def warm_up():
+    """
+    Run a first inference through YOLO and every OCR engine so the lazy
+    initialisation cost is not paid by the first real request.
+    """
+    try:
+        blank_frame = np.zeros((640, 640, 3), dtype=np.uint8)
+        detector.detect([blank_frame])
+
+        blank_plate = np.full((48, 160, 3), 255, dtype=np.uint8)
+        ocr_pool.warm_up(blank_plate)
+    except Exception as e:
+        print(f"Error during warm-up: {e}")
+    ready.set()
+    print("ANPR models warmed up, service ready")
+
+def fetch_image(url):
+    """Downloads an image and returns it as an RGB PIL image."""
+    resp = urllib.request.urlopen(url)
+    return Image.open(io.BytesIO(resp.read())).convert("RGB")
+
+def decode_image(image, reduction=1):
+    """Converts raw JPEG bytes or a PIL image to a BGR NumPy array."""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        nparr = np.frombuffer(image, np.uint8)
+        image = cv2.imdecode(nparr, REDUCED_DECODE_FLAGS.get(reduction, cv2.IMREAD_COLOR))
+    elif isinstance(image, Image.Image):
+        image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+    if image is None:
+        raise ValueError("Could not decode image")
+    return image
+
+def preprocess(image, gate_id=None):
+    """
+    Prepares a frame for detection.
+
+    Returns:
+        tuple: (frame cropped to the gate's ROI, the same frame resized for
+        the detector, scale from the frame to the resized one)
+    """
+    frame = decode_image(image, DECODE_REDUCTION)
+
+    roi = gate_rois.get(gate_id)
+    if roi is not None:
+        height, width = frame.shape[:2]
+        x1, y1, x2, y2 = roi
+        frame = frame[int(y1 * height):int(y2 * height), int(x1 * width):int(x2 * width)]
+
+    # Resize once to the model input; the detector's letterbox then only pads
+    height, width = frame.shape[:2]
+    scale = min(MODEL_INPUT_SIZE / height, MODEL_INPUT_SIZE / width, 1.0)
+    if scale < 1.0:
+        model_input = cv2.resize(frame, (int(round(width * scale)), int(round(height * scale))),
+                                 interpolation=cv2.INTER_AREA)
+    else:
+        model_input = frame
+    return frame, model_input, scale
+
+def crop_text_line(image, points):
+    """
+    Crops a (possibly rotated) text box found by the OCR detector, the same
+    way PaddleOCR does before running recognition.
+    """
+    width = int(max(np.linalg.norm(points[0] - points[1]), np.linalg.norm(points[2] - points[3])))
+    height = int(max(np.linalg.norm(points[0] - points[3]), np.linalg.norm(points[1] - points[2])))
+    target = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    matrix = cv2.getPerspectiveTransform(points, target)
+    line = cv2.warpPerspective(image, matrix, (width, height),
+                               borderMode=cv2.BORDER_REPLICATE, flags=cv2.INTER_CUBIC)
+    if line.shape[0] * 1.0 / max(line.shape[1], 1) >= 1.5:
+        line = np.rot90(line)
+    return line
+
+def recognize_plates(plate_images):
+    """
+    Runs OCR over a list of plate crops with a single engine checkout.
+    Text lines are located per crop and then recognised together in one
+    batched recognition call.
+
+    Returns:
+        list: (plate_text, confidence) for each crop
+    """
+    per_plate = [[] for _ in plate_images]
+    if not plate_images:
+        return []
+
+    with ocr_pool.engine() as ocr:
+        lines = []
+        owners = []
+        for index, plate_image in enumerate(plate_images):
+            det_result = ocr.ocr(plate_image, det=True, rec=False, cls=False)
+            boxes = det_result[0] if det_result and det_result[0] else []
+            for box in boxes:
+                lines.append(crop_text_line(plate_image, np.array(box, dtype=np.float32)))
+                owners.append((index, box))
+
+        if lines:
+            rec_result = ocr.ocr(lines, det=False, cls=True)[0]
+            for (index, box), text_and_score in zip(owners, rec_result):
+                per_plate[index].append([box, text_and_score])
+
+    return [extract_license_plate([plate_lines]) for plate_lines in per_plate]
+
+def detect_and_recognize_batch(requests):
+    """
+    Detects and recognizes license plates on a batch of images using one
+    YOLO call for all frames and one batched OCR pass over the plate crops.
+
+    Args:
+        requests (list): (image, gate_id, debug) tuples
+
+    Returns:
+        list: (processed_image, plate_text, confidence) per image, or the
+        Exception raised while decoding that image. processed_image is an
+        annotated copy of the frame when debug is set, None otherwise.
+    """
+    results = []
+    frames = []
+    model_inputs = []
+    scales = []
+    for image, gate_id, debug in requests:
+        try:
+            frame, model_input, scale = preprocess(image, gate_id)
+            frames.append(frame)
+            model_inputs.append(model_input)
+            scales.append(scale)
+            results.append((frame.copy() if debug else None, "No plate detected", 0.0))
+        except Exception as e:
+            frames.append(None)
+            model_inputs.append(None)
+            scales.append(None)
+            results.append(e)
+
+    valid = [index for index, frame in enumerate(frames) if frame is not None]
+    if not valid:
+        return results
+
+    # YOLO detection over the whole batch
+    try:
+        detections = detector.detect([model_inputs[index] for index in valid])
+    except Exception as e:
+        print(f"Error during YOLO detection: {e}")
+        return results
+
+    # Extract the first detected plate of every frame, cropped from the
+    # full-resolution frame so OCR does not lose detail to the resize
+    crops = []
+    crop_owners = []
+    for index, boxes in zip(valid, detections):
+        if len(boxes) == 0:
+            continue
+        x1, y1, x2, y2 = (int(value / scales[index]) for value in boxes[0][:4])
+        plate_image = frames[index][y1:y2, x1:x2]
+        if plate_image.size == 0:
+            continue
+        crops.append(plate_image)
+        crop_owners.append((index, (x1, y1, x2, y2)))
+
+    # OCR on plate regions
+    try:
+        texts = recognize_plates(crops)
+    except Exception as e:
+        print(f"Error during OCR: {e}")
+        return results
+
+    for (index, (x1, y1, x2, y2)), (detected_text, confidence_score) in zip(crop_owners, texts):
+        processed_image = results[index][0]
+        if processed_image is not None and detected_text != "No plate detected":
+            # Draw bounding box and text
+            cv2.rectangle(processed_image, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(processed_image, detected_text, (x1, y1 - 10),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        results[index] = (processed_image, detected_text, confidence_score)
+
+    return results
+
+def detect_and_recognize(image, gate_id=None, debug=ANPR_DEBUG):
+    """
+    Detects and recognizes license plates from an image using YOLO and PaddleOCR.
+    The image is queued on the micro-batcher and processed together with
+    frames sent by other concurrent requests.
+
+    Args:
+        image: Raw JPEG bytes or a PIL image
+        gate_id (str): Gate that sent the frame, selects its region of interest
+        debug (bool): Also return an annotated copy of the frame
+    """
+    return batcher.process((image, gate_id, debug))
+
+# One batching worker per OCR engine: while one batch is in OCR the next
+# one can already run through YOLO
+batcher = MicroBatcher(
+    detect_and_recognize_batch,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    num_workers=OCR_POOL_SIZE
+)
@@ -1,121 +1,47 @@
-from ultralytics import YOLO
 from flask import Flask, request, Response, jsonify, render_template
-import io
-from PIL import Image
-import urllib.request
-import cv2
-import numpy as np
-from paddleocr import PaddleOCR
-import re
 import os
-
-# Initialize models
-model = YOLO("./models/best.pt")
+import threading
+from anpr import batcher, detect_and_recognize, fetch_image, ready, warm_up
 
 
 # Initialize Flask
 app = Flask(__name__)
 
-def encode_image_pil(image):
-    """Converts a NumPy array to JPEG bytes using PIL."""
-    if image.shape[2] == 3:  # If image has 3 channels (RGB/BGR)
-        image = image[..., ::-1]  # Invert channels to convert BGR to RGB
-    
-    pil_img = Image.fromarray(image)
-    img_byte_arr = io.BytesIO()  # Create a bytes buffer in memory
-    pil_img.save(img_byte_arr, format="JPEG")  # Save as JPEG
-    return img_byte_arr.getvalue()
-
-def extract_license_plate(ocr_result, confidence_threshold=0.7):
-    """
-    Extracts and cleans the text OCR with highest confidence.
-    """
-    if not ocr_result or not ocr_result[0]:
-        return "No plate detected", 0.0
-
-    best_text = ""
-    max_confidence = 0
-
-    for detection in ocr_result[0]:
-        text = detection[1][0]
-        confidence = detection[1][1]
-
-        if confidence > confidence_threshold and confidence > max_confidence:
-            best_text = text
-            max_confidence = confidence
-
-    cleaned_text = re.sub(r'[^A-Za-z0-9]', '', best_text).upper()
-    return cleaned_text if cleaned_text else "No plate detected", max_confidence
-
-def detect_and_recognize(image):
-    """
-    Detects and recognizes license plates from an image using YOLO and PaddleOCR.
-    """
-    if isinstance(image, bytes):
-        nparr = np.frombuffer(image, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    elif isinstance(image, Image.Image):
-        image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-    
-    original_image = image.copy()
-    detected_text = "No plate detected"
-    confidence_score = 0.0
-
-    # YOLO detection
-    detections = []
-    try:
-        results = model.predict(source=image, save=False)
-        if not results or len(results) == 0 or len(results[0].boxes.data) == 0:
-            return original_image, detected_text, confidence_score
-        detections = results[0].boxes.data
-    except Exception as e:
-        print(f"Error during YOLO detection: {e}")
-        return original_image, detected_text, confidence_score
-
-    if len(detections) == 0:
-        return original_image, detected_text, confidence_score
-
-    for detection in detections[:1]:  # Only process the first detection
-        x1, y1, x2, y2, conf, cls = detection[:6]
-        x1, y1, x2, y2 = map(int, [x1, y1, x2, y2])
+# Set when the worker is shutting down, so load balancers stop sending it traffic
+draining = threading.Event()
 
-        # Extract plate region
-        plate_image = image[y1:y2, x1:x2]
-        if plate_image.size == 0:
-            continue
+@app.route('/api/health', methods=['GET'])
+def health():
+    """Liveness probe: the process is up and serving requests."""
+    return jsonify({'status': 'ok'})
 
-        # OCR on plate region
-        try:
-            ocr = PaddleOCR(use_angle_cls=True, lang="en")
-            ocr_result = ocr.ocr(plate_image, cls=True)
-            detected_text, confidence_score = extract_license_plate(ocr_result)
-        except Exception as e:
-            print(f"Error during OCR: {e}")
-            continue
-
-
-        if detected_text != "No plate detected":
-            # Draw bounding box and text
-            cv2.rectangle(original_image, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            cv2.putText(original_image, detected_text, (x1, y1 - 10),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-
-    return original_image, detected_text, confidence_score
+@app.route('/api/ready', methods=['GET'])
+def readiness():
+    """Readiness probe: the models are loaded and warmed up."""
+    if draining.is_set():
+        return jsonify({'status': 'draining'}), 503
+    if not ready.is_set():
+        return jsonify({'status': 'warming_up'}), 503
+    return jsonify({'status': 'ready'})
 
 @app.route('/api/anpr', methods=['POST'])
 def anpr_detect():
     """
     API endpoint for license plate detection and recognition.
-    Accepts an image file and returns both the processed image and the detected plate text.
+    Accepts an image file, or the raw image as the request body with an
+    image/* content type, and returns the detected plate text.
     """
     try:
-        if 'image' not in request.files:
+        if request.mimetype.startswith('image/'):
+            img = request.get_data()
+        elif 'image' in request.files:
+            img = request.files['image'].read()
+        else:
             return jsonify({
                 'error': 'No image file provided'
             }), 400
 
-        img = request.files['image'].read()
-        processed_image, plate_text, confidence = detect_and_recognize(img)
+        processed_image, plate_text, confidence = detect_and_recognize(img, gate_id=request.values.get('gate_id'))
         
         # Encode the processed image
         # img_encoded = encode_image_pil(processed_image)
@@ -144,9 +70,8 @@ def anpr_detect_from_url():
         return jsonify({"error": "URL image not provided"}), 400
 
     try:
-        resp = urllib.request.urlopen(image_url)
-        pil_img = Image.open(io.BytesIO(resp.read())).convert("RGB")
-        processed_image, plate_text, confidence = detect_and_recognize(pil_img)
+        pil_img = fetch_image(image_url)
+        processed_image, plate_text, confidence = detect_and_recognize(pil_img, gate_id=request.values.get('gate_id'))
         
         # Encode the processed image
         # img_encoded = encode_image_pil(processed_image)
@@ -164,5 +89,48 @@ def anpr_detect_from_url():
             'error': str(e)
         }), 500
 
+@app.route('/api/anpr/batch', methods=['POST'])
+def anpr_detect_batch():
+    """
+    API endpoint for license plate detection on several images at once.
+    Accepts one or more image files in the 'images' field and returns one
+    result per file, in the order they were sent.
+    """
+    files = request.files.getlist('images')
+    if not files:
+        return jsonify({
+            'error': 'No image files provided'
+        }), 400
+
+    try:
+        gate_id = request.values.get('gate_id')
+        futures = [batcher.submit((f.read(), gate_id, False)) for f in files]
+
+        results = []
+        for f, future in zip(files, futures):
+            try:
+                _, plate_text, confidence = future.result()
+                results.append({
+                    'filename': f.filename,
+                    'plate_text': plate_text,
+                    'confidence': float(confidence)
+                })
+            except Exception as e:
+                results.append({
+                    'filename': f.filename,
+                    'error': str(e)
+                })
+
+        return jsonify({'results': results})
+
+    except Exception as e:
+        return jsonify({
+            'error': str(e)
+        }), 500
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=4000, debug=True)
+    # Development server only; the container runs gunicorn (see gunicorn.conf.py).
+    # No reloader: it would load the models a second time
+    threading.Thread(target=warm_up, daemon=True).start()
+    app.run(host='0.0.0.0', port=4000, debug=os.getenv('FLASK_DEBUG', 'false').lower() in ('1', 'true', 'yes'),
+            use_reloader=False, threaded=True)
@@ -0,0 +1,79 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Collects items submitted by many request threads and processes them together.
+
+    A batch is closed when it holds max_batch_size items or when max_wait_ms
+    have passed since its first item arrived. process_batch receives the list
+    of items and must return one result per item, in the same order. A result
+    that is an Exception instance is raised to that item's caller only.
+    """
+
+    def __init__(self, process_batch, max_batch_size=8, max_wait_ms=10, num_workers=1):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0, max_wait_ms) / 1000.0
+        self.num_workers = max(1, num_workers)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+
+    def submit(self, item):
+        """Queue an item and return a Future for its result"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def process(self, item, timeout=None):
+        """Submit an item and wait for its result"""
+        return self.submit(item).result(timeout=timeout)
+
+    def _ensure_started(self):
+        # Threads do not survive a fork, so a forked worker process starts its own
+        with self._lock:
+            if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+                return
+            self._pid = os.getpid()
+            self._threads = []
+            for index in range(self.num_workers):
+                thread = threading.Thread(target=self._run, name=f"batcher-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = self.process_batch(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
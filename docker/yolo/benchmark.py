@@ -0,0 +1,113 @@
+"""
+Compare the plate detector backends on a fixed set of images.
+
+Runs every image through each backend, reports the latency per image and
+how closely each backend's best detection matches the PyTorch one, which
+is the reference.
+
+Usage:
+    python benchmark.py --images path/to/images [--backends pytorch onnx openvino] [--int8] [--threads 4]
+"""
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from detector import BACKENDS, create_detector
+
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png')
+
+
+def load_images(directory):
+    paths = sorted(path for pattern in IMAGE_PATTERNS for path in glob.glob(os.path.join(directory, pattern)))
+    images = [(os.path.basename(path), cv2.imread(path, cv2.IMREAD_COLOR)) for path in paths]
+    return [(name, image) for name, image in images if image is not None]
+
+
+def box_iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    intersection = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def run_backend(detector, images, repeat):
+    """
+    Returns:
+        tuple: (latencies in ms, best detection per image or None)
+    """
+    # The first call pays for lazy initialisation, keep it out of the numbers
+    detector.detect([images[0][1]])
+
+    latencies = []
+    best = []
+    for _, image in images:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            boxes = detector.detect([image])[0]
+            latencies.append((time.perf_counter() - start) * 1000)
+        best.append(boxes[0] if len(boxes) else None)
+    return latencies, best
+
+
+def compare(reference, best, iou_threshold=0.5):
+    """
+    Returns:
+        tuple: (share of images agreeing with the reference, mean IoU where both found a plate)
+    """
+    agree = 0
+    ious = []
+    for ref, box in zip(reference, best):
+        if ref is None or box is None:
+            agree += ref is None and box is None
+            continue
+        iou = box_iou(ref, box)
+        ious.append(iou)
+        agree += iou >= iou_threshold
+    return agree / len(reference), (float(np.mean(ious)) if ious else float('nan'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the plate detector backends')
+    parser.add_argument('--images', required=True, help='Directory with the test images')
+    parser.add_argument('--weights', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'best.pt'),
+                        help='YOLO .pt weights')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--int8', action='store_true', help='Also run the INT8 variant of the exported backends')
+    parser.add_argument('--threads', type=int, default=None, help='Intra-op threads per backend')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per image')
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    if not images:
+        parser.error(f"No images found in {args.images}")
+
+    runs = [(backend, False) for backend in args.backends]
+    if args.int8:
+        runs += [(backend, True) for backend in args.backends if backend != 'pytorch']
+    # PyTorch first: it is the reference for accuracy
+    if ('pytorch', False) in runs:
+        runs.remove(('pytorch', False))
+    runs.insert(0, ('pytorch', False))
+
+    print(f"{len(images)} images, {args.repeat} runs each, threads={args.threads or 'default'}\n")
+    print(f"{'backend':<16}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'agreement':>12}{'mean IoU':>10}")
+
+    reference = None
+    for backend, int8 in runs:
+        detector = create_detector(backend, args.weights, threads=args.threads, int8=int8)
+        latencies, best = run_backend(detector, images, args.repeat)
+        if reference is None:
+            reference = best
+        agreement, mean_iou = compare(reference, best)
+        name = backend + (' int8' if int8 else '')
+        print(f"{name:<16}{np.mean(latencies):>10.1f}{np.percentile(latencies, 50):>10.1f}"
+              f"{np.percentile(latencies, 95):>10.1f}{agreement:>11.0%}{mean_iou:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""
+Licence plate detectors for the ANPR pipeline.
+
+Every detector takes a list of BGR frames and returns, per frame, an
+(N, 6) float array of x1, y1, x2, y2, confidence, class sorted by
+confidence, in the pixel coordinates of that frame.
+
+- pytorch: the ultralytics model on the .pt weights (eager PyTorch)
+- onnx: the model exported to ONNX, run with ONNX Runtime
+- openvino: the same ONNX export, compiled by OpenVINO for the CPU
+
+The ONNX export (and its optional INT8 variant) is cached next to the .pt
+weights and redone only when the weights are newer than the export.
+"""
+import os
+import threading
+
+import cv2
+import numpy as np
+
+BACKENDS = ('pytorch', 'onnx', 'openvino')
+
+# Same defaults as ultralytics predict()
+CONF_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.7
+
+
+def _is_fresh(path, source):
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source)
+
+
+def export_onnx(weights_path, imgsz=640):
+    """Export the .pt weights to ONNX unless an up-to-date export exists"""
+    onnx_path = os.path.splitext(weights_path)[0] + '.onnx'
+    if not _is_fresh(onnx_path, weights_path):
+        from ultralytics import YOLO
+        print(f"Exporting {weights_path} to ONNX")
+        # Dynamic axes so micro-batches of any size can be run
+        exported = YOLO(weights_path).export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+        if os.path.abspath(exported) != os.path.abspath(onnx_path):
+            os.replace(exported, onnx_path)
+    return onnx_path
+
+
+def quantize_onnx(onnx_path):
+    """Create an INT8 (dynamic quantization) copy of an ONNX model unless an up-to-date one exists"""
+    int8_path = os.path.splitext(onnx_path)[0] + '.int8.onnx'
+    if not _is_fresh(int8_path, onnx_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        print(f"Quantizing {onnx_path} to INT8")
+        quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+    return int8_path
+
+
+def letterbox(frame, size):
+    """Resize keeping the aspect ratio and pad to size x size, like ultralytics does"""
+    height, width = frame.shape[:2]
+    ratio = min(size / height, size / width)
+    new_width, new_height = int(round(width * ratio)), int(round(height * ratio))
+    pad_x, pad_y = (size - new_width) / 2, (size - new_height) / 2
+    if (new_width, new_height) != (width, height):
+        frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    frame = cv2.copyMakeBorder(frame, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return frame, ratio, (left, top)
+
+
+class PyTorchDetector:
+    """The ultralytics model on the original weights"""
+
+    def __init__(self, weights_path, threads=None):
+        import torch
+        from ultralytics import YOLO
+        if threads:
+            torch.set_num_threads(threads)
+        self.model = YOLO(weights_path)
+        self._lock = threading.Lock()  # YOLO predictors are not thread-safe
+
+    def detect(self, frames):
+        with self._lock:
+            predictions = self.model.predict(source=list(frames), save=False, verbose=False)
+        return [prediction.boxes.data.cpu().numpy() for prediction in predictions]
+
+
+class _ExportedDetector:
+    """Pre- and post-processing shared by the ONNX Runtime and OpenVINO detectors"""
+    imgsz = 640
+
+    def __init__(self, onnx_path, threads=None):
+        self.onnx_path = onnx_path
+        self.threads = threads
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._runtime = self._load()
+
+    def _get_runtime(self):
+        # The runtimes' thread pools do not survive a fork, so a forked
+        # worker process loads its own copy of the model: unlike the PyTorch
+        # weights, exported models are not shared between gunicorn workers
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._runtime = self._load()
+            return self._runtime
+
+    def _preprocess(self, frames):
+        batch = []
+        transforms = []
+        for frame in frames:
+            padded, ratio, offset = letterbox(frame, self.imgsz)
+            batch.append(padded)
+            transforms.append((ratio, offset, frame.shape[:2]))
+        # BGR HWC uint8 -> RGB NCHW float32 in [0, 1]
+        blob = np.stack(batch)[..., ::-1].transpose(0, 3, 1, 2)
+        return np.ascontiguousarray(blob, dtype=np.float32) / 255.0, transforms
+
+    def _postprocess(self, output, transforms):
+        results = []
+        # output: (batch, 4 + classes, anchors) with boxes as cx, cy, w, h
+        for prediction, (ratio, (left, top), (height, width)) in zip(output, transforms):
+            prediction = prediction.T
+            scores = prediction[:, 4:]
+            classes = scores.argmax(axis=1)
+            confidences = scores[np.arange(len(scores)), classes]
+            keep = confidences > CONF_THRESHOLD
+            if not keep.any():
+                results.append(np.zeros((0, 6), dtype=np.float32))
+                continue
+
+            boxes = prediction[keep, :4]
+            confidences, classes = confidences[keep], classes[keep]
+            xyxy = np.empty_like(boxes)
+            xyxy[:, :2] = boxes[:, :2] - boxes[:, 2:] / 2
+            xyxy[:, 2:] = boxes[:, :2] + boxes[:, 2:] / 2
+
+            nms_boxes = [[x1, y1, x2 - x1, y2 - y1] for x1, y1, x2, y2 in xyxy.tolist()]
+            indices = cv2.dnn.NMSBoxes(nms_boxes, confidences.tolist(), CONF_THRESHOLD, IOU_THRESHOLD)
+            indices = np.array(indices, dtype=np.int64).reshape(-1)
+            indices = indices[np.argsort(-confidences[indices])]
+
+            # Undo the letterbox
+            xyxy = xyxy[indices]
+            xyxy[:, [0, 2]] = ((xyxy[:, [0, 2]] - left) / ratio).clip(0, width)
+            xyxy[:, [1, 3]] = ((xyxy[:, [1, 3]] - top) / ratio).clip(0, height)
+            results.append(np.column_stack([xyxy, confidences[indices], classes[indices]]).astype(np.float32))
+        return results
+
+    def detect(self, frames):
+        if not frames:
+            return []
+        blob, transforms = self._preprocess(frames)
+        return self._postprocess(self._infer(blob), transforms)
+
+
+class ONNXRuntimeDetector(_ExportedDetector):
+    """The exported model run by ONNX Runtime on the CPU"""
+
+    def _load(self):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+        return ort.InferenceSession(self.onnx_path, options, providers=['CPUExecutionProvider'])
+
+    def _infer(self, blob):
+        session = self._get_runtime()
+        # InferenceSession.run is thread-safe
+        return session.run(None, {session.get_inputs()[0].name: blob})[0]
+
+
+class OpenVINODetector(_ExportedDetector):
+    """The exported model compiled by OpenVINO for the CPU"""
+
+    def _load(self):
+        import openvino as ov
+        config = {'PERFORMANCE_HINT': 'LATENCY'}
+        if self.threads:
+            config['INFERENCE_NUM_THREADS'] = self.threads
+        core = ov.Core()
+        return core.compile_model(core.read_model(self.onnx_path), 'CPU', config)
+
+    def _infer(self, blob):
+        # One infer request per call, so concurrent callers don't share state
+        request = self._get_runtime().create_infer_request()
+        request.infer({0: blob})
+        return request.get_output_tensor(0).data.copy()
+
+
+def create_detector(backend, weights_path, threads=None, int8=False):
+    """
+    Create the detector for an inference backend
+
+    Args:
+        backend (str): One of BACKENDS
+        weights_path (str): Path of the .pt weights
+        threads (int): Intra-op threads, the library default if None
+        int8 (bool): Run the INT8-quantized export (onnx and openvino only)
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    if backend == 'pytorch':
+        if int8:
+            print("INT8 is only available for exported models, running the original weights")
+        return PyTorchDetector(weights_path, threads)
+
+    model_path = export_onnx(weights_path)
+    if int8:
+        model_path = quantize_onnx(model_path)
+    if backend == 'onnx':
+        return ONNXRuntimeDetector(model_path, threads)
+    return OpenVINODetector(model_path, threads)
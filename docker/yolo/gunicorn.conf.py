@@ -0,0 +1,68 @@
+"""
+Gunicorn settings for the YOLO service.
+
+The app is loaded once in the master before forking. The PaddleOCR engines
+and, with INFERENCE_BACKEND=pytorch, the YOLO model are shared by the
+workers copy-on-write. The onnx and openvino backends can't be shared: their
+runtimes start thread pools that do not survive a fork, so every worker
+loads its own copy of the exported model on its first inference. Its
+weights and the runtime's buffers then count once per worker, so size
+WEB_CONCURRENCY for that memory. Every worker warms the models
+up after the fork, and on shutdown reports itself as not ready for
+DRAIN_SECONDS before it stops taking requests.
+
+Usage:
+    gunicorn -c gunicorn.conf.py app:app
+"""
+import multiprocessing
+import os
+import signal
+import threading
+
+cpu_count = multiprocessing.cpu_count()
+
+bind = os.getenv('BIND', '0.0.0.0:4000')
+
+# Each worker runs its own detector and OCR engines; threads keep enough
+# requests in flight per worker to fill the micro-batches. With the onnx or
+# openvino backend every worker also holds its own copy of the model
+workers = int(os.getenv('WEB_CONCURRENCY', max(1, cpu_count // 2)))
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', 8))
+
+# Split the cores between the workers instead of letting every worker's
+# detector use all of them. Read by anpr.py when the app is preloaded below
+os.environ.setdefault('INFERENCE_THREADS', str(max(1, cpu_count // workers)))
+
+preload_app = True
+
+timeout = int(os.getenv('WEB_TIMEOUT', 60))
+keepalive = 5
+
+# Seconds a stopping worker keeps serving while reporting not ready
+DRAIN_SECONDS = int(os.getenv('DRAIN_SECONDS', 5))
+graceful_timeout = DRAIN_SECONDS + int(os.getenv('GRACEFUL_TIMEOUT', 30))
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_worker_init(worker):
+    """Warm the models up in the worker and install the draining shutdown"""
+    from anpr import warm_up
+    from app import draining
+
+    # Inference must not run in the master: thread pools started before
+    # the fork would be unusable in the workers
+    threading.Thread(target=warm_up, name='anpr-warm-up', daemon=True).start()
+
+    stop = worker.handle_exit
+
+    def handle_exit(sig, frame):
+        if draining.is_set():
+            return
+        draining.set()
+        worker.log.info("Worker %s draining for %ss", worker.pid, DRAIN_SECONDS)
+        threading.Timer(DRAIN_SECONDS, stop, (sig, frame)).start()
+
+    signal.signal(signal.SIGTERM, handle_exit)
@@ -12,6 +12,7 @@ YOLO_API_URL = "http://127.0.0.1:4000/api/anpr"
 
 TOPIC_GATE_STATUS = "gate/1/status"
 TOPIC_GATE_ACCESS = "gate/1/access"
+TOPIC_GATE_ACCESS_RAW = "gate/1/access/raw"
 TOPIC_GATE_SYNC = "gate/1/sync"
 TOPIC_SERVER_RESPONSE = "server/response/{gate_id}"
 
@@ -40,7 +41,7 @@ def test_yolo_api(image_url):
         print(f"Error testing YOLO API: {e}")
         return None
 
-def test_mqtt(image_url):
+def test_mqtt(image_url, binary=False):
     """Test sending image through MQTT"""
     client = mqtt.Client()
     client.username_pw_set(USERNAME, PASSWORD)
@@ -53,10 +54,14 @@ def test_mqtt(image_url):
         response.raise_for_status()
         
         image_bytes = response.content
-        msg = base64.b64encode(image_bytes).decode('utf-8')
-        payload = json.dumps({"image": msg})
-        client.publish(TOPIC_GATE_ACCESS, payload)
-        print(f"Sent image through MQTT")
+        if binary:
+            # Raw JPEG bytes, no base64 or JSON framing
+            client.publish(TOPIC_GATE_ACCESS_RAW, image_bytes)
+        else:
+            msg = base64.b64encode(image_bytes).decode('utf-8')
+            payload = json.dumps({"image": msg})
+            client.publish(TOPIC_GATE_ACCESS, payload)
+        print(f"Sent image through MQTT ({'binary' if binary else 'JSON'})")
         time.sleep(1)
     except Exception as e:
         print(f"Error in MQTT test: {e}")
@@ -68,6 +73,8 @@ def main():
     parser = argparse.ArgumentParser(description='Test ANPR system')
     parser.add_argument('--mode', choices=['mqtt', 'api', 'both'], default='both',
                       help='Test mode: mqtt, api, or both')
+    parser.add_argument('--binary', action='store_true',
+                      help='Publish the raw image to the binary access topic instead of base64 JSON')
     args = parser.parse_args()
 
     image_url = "https://external-content.duckduckgo.com/iu/?u=https%3A%2F%2Fwww.articulo14.es%2Fmain-files%2Fuploads%2F2025%2F03%2Fmatricula-espana-162x95.jpg&f=1&nofb=1&ipt=aa1d633da11e464a5c28d0e3f10dba0a3a33f415e7b96c48609bdbafb42841d1"
@@ -78,7 +85,7 @@ def main():
 
     if args.mode in ['mqtt', 'both']:
         print("\n=== Testing MQTT ===")
-        test_mqtt(image_url)
+        test_mqtt(image_url, binary=args.binary)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file